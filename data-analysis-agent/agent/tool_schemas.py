@@ -7,7 +7,24 @@ LIST_FILES_TOOL_DESCRIPTION = (
     "List all CSV files available in the Spaces bucket with their metadata."
 )
 
-LIST_FILES_INPUT_SCHEMA = {"parameters": []}
+LIST_FILES_INPUT_SCHEMA = {
+    "parameters": [
+        {
+            "in": "query",
+            "name": "prefix",
+            "schema": {"type": "string"},
+            "required": False,
+            "description": "Only list files whose key starts with this prefix (optional)",
+        },
+        {
+            "in": "query",
+            "name": "max_files",
+            "schema": {"type": "integer"},
+            "required": False,
+            "description": "Maximum number of most recently modified files to return (optional, no limit by default)",
+        },
+    ]
+}
 
 LIST_FILES_OUTPUT_SCHEMA = {
     "properties": [
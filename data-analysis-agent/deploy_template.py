@@ -1,35 +1,24 @@
-import pydo
 import os
 import logging
 import argparse
-import boto3
+import asyncio
+import collections
 import time
+import random
+import concurrent.futures
+import functools
 import subprocess
 import tempfile
 import shutil
-import secrets
+import base64
+import hashlib
 from typing import Optional
-from agent.prompts import (
-    SYSTEM_PROMPT_TEMPLATE,
-)
-from agent.tool_schemas import (
-    LIST_FILES_TOOL_DESCRIPTION,
-    LIST_FILES_INPUT_SCHEMA,
-    LIST_FILES_OUTPUT_SCHEMA,
-    LOAD_CSV_TOOL_DESCRIPTION,
-    LOAD_CSV_INPUT_SCHEMA,
-    LOAD_CSV_OUTPUT_SCHEMA,
-    GET_COLUMN_INFO_TOOL_DESCRIPTION,
-    GET_COLUMN_INFO_INPUT_SCHEMA,
-    GET_COLUMN_INFO_OUTPUT_SCHEMA,
-    EXECUTE_PANDAS_CODE_TOOL_DESCRIPTION,
-    EXECUTE_PANDAS_CODE_INPUT_SCHEMA,
-    EXECUTE_PANDAS_CODE_OUTPUT_SCHEMA,
-)
+from pathlib import PurePosixPath
 from agent.constants import LLAMA_3_3_70B_UUID, EMBEDDING_MODEL_UUID, AGENT_NAME
-from dataclasses import dataclass
+from dataclasses import dataclass, field, fields
 from dotenv import load_dotenv
-import pydo
+
+DO_API_URL = "https://api.digitalocean.com"
 
 # Configure logging
 logging.basicConfig(
@@ -37,7 +26,7 @@ logging.basicConfig(
 )
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class AgentConfig:
     agent_name: str
     agent_description: str
@@ -46,20 +35,28 @@ class AgentConfig:
     region: str
     instruction: str
     knowledge_base_uuid: str
+    # The body is built once and reused, since it's both logged and sent
+    _dict: Optional[dict] = field(default=None, init=False, repr=False, compare=False)
 
     def to_dict(self):
-        return {
-            "name": self.agent_name,
-            "description": self.agent_description,
-            "instruction": self.instruction,
-            "model_uuid": self.model_uuid,
-            "project_id": self.project_id,
-            "region": self.region,
-            "knowledge_base_uuid": [self.knowledge_base_uuid],
-        }
+        if self._dict is None:
+            object.__setattr__(
+                self,
+                "_dict",
+                {
+                    "name": self.agent_name,
+                    "description": self.agent_description,
+                    "instruction": self.instruction,
+                    "model_uuid": self.model_uuid,
+                    "project_id": self.project_id,
+                    "region": self.region,
+                    "knowledge_base_uuid": [self.knowledge_base_uuid],
+                },
+            )
+        return self._dict
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class KBConfig:
     name: str
     project_id: str
@@ -67,28 +64,35 @@ class KBConfig:
     spaces_bucket: str
     region: str
     database_id: Optional[str] = None
+    _dict: Optional[dict] = field(default=None, init=False, repr=False, compare=False)
 
     # For ease of use, we only support local file paths for now
     def to_dict(self):
-        return {
-            "name": self.name,
-            "database_id": self.database_id,
-            "embedding_model_uuid": self.embedding_model_uuid,
-            "project_id": self.project_id,
-            "region": self.region,
-            "datasources": [
+        if self._dict is None:
+            object.__setattr__(
+                self,
+                "_dict",
                 {
-                    "spaces_data_source": {
-                        "bucket_name": self.spaces_bucket,
-                        "item_path": "",
-                        "region": self.region,
-                    }
-                }
-            ],
-        }
+                    "name": self.name,
+                    "database_id": self.database_id,
+                    "embedding_model_uuid": self.embedding_model_uuid,
+                    "project_id": self.project_id,
+                    "region": self.region,
+                    "datasources": [
+                        {
+                            "spaces_data_source": {
+                                "bucket_name": self.spaces_bucket,
+                                "item_path": "",
+                                "region": self.region,
+                            }
+                        }
+                    ],
+                },
+            )
+        return self._dict
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class AgentFunctionConfig:
     agent_uuid: str
     description: str
@@ -97,24 +101,100 @@ class AgentFunctionConfig:
     function_name: str
     input_schema: dict
     output_schema: dict
+    _dict: Optional[dict] = field(default=None, init=False, repr=False, compare=False)
 
     def to_dict(self):
-        return {
-            "agent_uuid": self.agent_uuid,
-            "description": self.description,
-            "faas_name": self.faas_name,
-            "faas_namespace": self.faas_namespace,
-            "function_name": self.function_name,
-            "input_schema": self.input_schema,
-            "output_schema": self.output_schema,
-        }
+        if self._dict is None:
+            # Field names already match the API body
+            object.__setattr__(
+                self,
+                "_dict",
+                {f.name: getattr(self, f.name) for f in fields(self) if f.init},
+            )
+        return self._dict
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class DOAuth:
     token: str
 
 
+def wait_until(
+    predicate,
+    initial: float = 5.0,
+    max_delay: float = 60.0,
+    timeout: float = 600.0,
+    factor: float = 1.7,
+):
+    """
+    Poll predicate with exponential backoff and jitter until it returns something other than None.
+    Returns the predicate's result, or None if timeout seconds pass first.
+    """
+    start_time = time.time()
+    delay = initial
+    while True:
+        result = predicate()
+        if result is not None:
+            return result
+        remaining = timeout - (time.time() - start_time)
+        if remaining <= 0:
+            return None
+        time.sleep(min(delay + random.uniform(0, delay * 0.1), remaining))
+        delay = min(delay * factor, max_delay)
+
+
+class _short:
+    # Truncated repr for large API responses, only rendered if the log record is emitted
+    __slots__ = ("value", "limit")
+
+    def __init__(self, value, limit: int = 500):
+        self.value = value
+        self.limit = limit
+
+    def __str__(self):
+        text = str(self.value)
+        if len(text) <= self.limit:
+            return text
+        return f"{text[: self.limit]}... ({len(text)} chars)"
+
+
+def _generate_tokens(count: int, nbytes: int = 16) -> list:
+    # Equivalent to calling secrets.token_urlsafe(nbytes) count times, but with a single urandom call
+    raw = os.urandom(count * nbytes)
+    return [
+        base64.urlsafe_b64encode(raw[i : i + nbytes]).rstrip(b"=").decode("ascii")
+        for i in range(0, len(raw), nbytes)
+    ]
+
+
+def _walk_files(root: str, relative: str = ""):
+    # Yields (path, posix relative path) for every file under root
+    # DirEntry caches its type, so this avoids the extra stat and relpath work done by os.walk
+    with os.scandir(root) as entries:
+        for entry in entries:
+            entry_relative = f"{relative}/{entry.name}" if relative else entry.name
+            if entry.is_dir(follow_symlinks=False):
+                yield from _walk_files(entry.path, entry_relative)
+            elif entry.is_file():
+                yield entry.path, entry_relative
+
+
+# Clients are shared between the deployers so they reuse the same warmed-up connection pools
+# pydo and boto3 are slow to import, so they are only loaded once a client is actually needed
+@functools.lru_cache(maxsize=8)
+def _pydo_client(token: str):
+    import pydo
+
+    return pydo.Client(token=token)
+
+
+@functools.lru_cache(maxsize=1)
+def _boto_session():
+    import boto3
+
+    return boto3.session.Session()
+
+
 # Deployment class for the Spaces folder containing KB data
 class SpacesDeployer:
     def __init__(
@@ -126,7 +206,10 @@ class SpacesDeployer:
         spaces_access_key: Optional[str] = None,
         spaces_secret_access_key: Optional[str] = None,
     ):
-        self.client = pydo.Client(token=token)
+        self.client = _pydo_client(token)
+        # Sub-clients are resolved once instead of on every call
+        self._spaces_key = self.client.spaces_key
+        self._databases = self.client.databases
         self.project_id = project_id
         self.generated_key = False
         self.bucket_name = bucket_name
@@ -148,44 +231,151 @@ class SpacesDeployer:
                 "Either the spaces access key or the secret key is None. Specify the key correctly, or set both to None to generate a new key"
             )
 
-        session = boto3.session.Session()
+        from boto3.s3.transfer import TransferConfig
+        from botocore.config import Config
+
+        # Transient 5xx errors and connection resets are retried inside the upload instead of aborting the deploy
+        # The pool is sized so the concurrent uploads don't queue up waiting for a connection
+        botocore_config = Config(
+            retries={"max_attempts": 10, "mode": "adaptive"},
+            connect_timeout=10,
+            read_timeout=60,
+            max_pool_connections=32,
+        )
+        session = _boto_session()
         self.boto_client = session.client(
             "s3",
             region_name=region,
             endpoint_url=f"https://{region}.digitaloceanspaces.com",
             aws_access_key_id=self.access_key,
             aws_secret_access_key=self.secret_key,
+            config=botocore_config,
+        )
+        # Files above the threshold are uploaded as concurrent multipart chunks. Smaller files are sent with a single PUT
+        # Larger parts and more threads than the boto3 defaults suit the large CSVs that are common for this template
+        # boto3 grows the chunk size on its own when a file would otherwise need more than 10,000 parts
+        self.transfer_config = TransferConfig(
+            multipart_threshold=16 * 1024 * 1024,
+            multipart_chunksize=32 * 1024 * 1024,
+            max_concurrency=16,
+            use_threads=True,
         )
 
     # This creates a full access key first in order to create a new bucket
     # Unfortunately, full access keys can't have their permissions updated, so this key gets deleted later for security
     def _create_spaces_key(self, bucket_name):
-        return self.client.spaces_key.create(
+        return self._spaces_key.create(
             body={
                 "name": f"Docs Agent Key for {bucket_name}",
                 "grants": [{"bucket": "", "permission": "fullaccess"}],
             }
         )
 
-    def upload_folder_to_space(self, folder_path, prefix=""):
-        for root, dirs, files in os.walk(folder_path):
-            for file in files:
-                local_path = os.path.join(root, file)
-                relative_path = os.path.relpath(local_path, folder_path)
-                s3_key = os.path.join(prefix, relative_path).replace("\\", "/")
+    def _iter_upload_paths(self, folder_path, prefix=""):
+        for local_path, relative_path in _walk_files(folder_path):
+            yield local_path, str(PurePosixPath(prefix, relative_path))
 
+    def _list_existing_objects(self, prefix=""):
+        # Maps each key already in the bucket to its (size, etag), so a re-run can skip unchanged files
+        existing = {}
+        try:
+            paginator = self.boto_client.get_paginator("list_objects_v2")
+            for page in paginator.paginate(Bucket=self.bucket_name, Prefix=prefix):
+                for obj in page.get("Contents", []):
+                    existing[obj["Key"]] = (obj["Size"], obj["ETag"].strip('"'))
+        except Exception as e:
+            logging.warning(
+                f"Could not list existing objects, uploading everything: {e}"
+            )
+            return {}
+        return existing
+
+    def _is_uploaded(self, local_path, s3_key, existing):
+        if s3_key not in existing:
+            return False
+        size, etag = existing[s3_key]
+        local_size = os.path.getsize(local_path)
+        if local_size != size:
+            return False
+        return self._local_etag(local_path, local_size) == etag
+
+    def _local_etag(self, local_path, size):
+        # Files under the threshold are uploaded in one request, so their ETag is the MD5 of the content.
+        # A multipart ETag is the MD5 of the concatenated part MD5s followed by "-<part count>"
+        multipart = size >= self.transfer_config.multipart_threshold
+        part_size = self.transfer_config.multipart_chunksize if multipart else size
+        digests = []
+        with open(local_path, "rb") as f:
+            for start in range(0, max(size, 1), max(part_size, 1)):
+                md5 = hashlib.md5(usedforsecurity=False)
+                remaining = min(part_size, size - start)
+                while remaining > 0:
+                    chunk = f.read(min(remaining, 1024 * 1024))
+                    if not chunk:
+                        break
+                    md5.update(chunk)
+                    remaining -= len(chunk)
+                digests.append(md5)
+        if not multipart:
+            return digests[0].hexdigest()
+        combined = hashlib.md5(
+            b"".join(md5.digest() for md5 in digests), usedforsecurity=False
+        )
+        return f"{combined.hexdigest()}-{len(digests)}"
+
+    def _upload_file(self, local_path, s3_key, existing=None):
+        if existing and self._is_uploaded(local_path, s3_key, existing):
+            if logging.getLogger().isEnabledFor(logging.INFO):
                 logging.info(
-                    f"Uploading {local_path} to s3://{self.bucket_name}/{s3_key}"
+                    "Skipping %s, already uploaded to s3://%s/%s",
+                    local_path,
+                    self.bucket_name,
+                    s3_key,
                 )
-                self.boto_client.upload_file(local_path, self.bucket_name, s3_key)
+            return
+        if logging.getLogger().isEnabledFor(logging.INFO):
+            logging.info(
+                "Uploading %s to s3://%s/%s", local_path, self.bucket_name, s3_key
+            )
+        self.boto_client.upload_file(
+            local_path, self.bucket_name, s3_key, Config=self.transfer_config
+        )
+
+    def upload_folder_to_space(self, folder_path, prefix="", max_workers=16):
+        existing = self._list_existing_objects(prefix)
+        # Uploads are network bound, so files are uploaded concurrently
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [
+                executor.submit(self._upload_file, local_path, s3_key, existing)
+                for local_path, s3_key in self._iter_upload_paths(folder_path, prefix)
+            ]
+            # Surface the first upload error, if any
+            for future in concurrent.futures.as_completed(futures):
+                future.result()
+
+    def _wait_bucket_exists(self, timeout: int = 60):
+        # Poll until the bucket can be fetched, which means the creation request was accepted
+        def _bucket_exists():
+            try:
+                self.boto_client.head_bucket(Bucket=self.bucket_name)
+                return True
+            except Exception as e:
+                logging.info(f"Bucket {self.bucket_name} is not available yet: {e}")
+                return None
+
+        if wait_until(_bucket_exists, initial=0.5, max_delay=5.0, timeout=timeout):
+            return True
+        logging.warning(
+            f"Bucket {self.bucket_name} was not available after {timeout} seconds. Continuing anyway..."
+        )
+        return False
 
     def create_bucket(self):
         self.boto_client.create_bucket(Bucket=self.bucket_name)
         # When a bucket is created, it is always added to the default project
         # The bucket needs to be moved into the project with the agent and DB
         bucket_urn = f"do:space:{self.bucket_name}"
-        # Wait for a few seconds for the bucket creation request to be accepted
-        time.sleep(5)
+        self._wait_bucket_exists()
         logging.info("Moving bucket into project...")
         self.client.projects.assign_resources(
             project_id=self.project_id, body={"resources": [bucket_urn]}
@@ -195,75 +385,92 @@ class SpacesDeployer:
         if self.generated_key:
             # This key was generated as part of the deployment. Delete it
             logging.info("Deleting spaces key generated during deployment..")
-            self.client.spaces_key.delete(access_key=self.access_key)
+            self._spaces_key.delete(access_key=self.access_key)
 
     def wait_for_database_ready(self, kb_database_id: str, max_wait_time: int = 600):
         """
         Wait for the database associated with the knowledge base to be ready.
-        Checks every 60 seconds until the database status is 'online' or max_wait_time is reached.
+        Polls with exponential backoff (5 seconds up to 60 seconds) until the database status is 'online' or max_wait_time is reached.
         """
         logging.info("Waiting for database to be ready...")
         start_time = time.time()
+        get_cluster = self._databases.get_cluster
 
-        while time.time() - start_time < max_wait_time:
+        def _check_database_status():
             try:
                 # Get database cluster status
                 logging.info("Checking database status...")
-                response = self.client.databases.get_cluster(
+                response = get_cluster(
                     database_cluster_uuid=kb_database_id,
                 )
+            except Exception as e:
+                logging.warning(f"Error checking database status: {e}. Retrying...")
+                return None
 
-                database_info = response.get("database", {})
-                status = database_info.get("status", "unknown")
+            database_info = response.get("database", {})
+            status = database_info.get("status", "unknown")
 
-                logging.info(f"Database status: {status}")
+            logging.info(f"Database status: {status}")
 
-                if status == "online":
-                    logging.info("Database is ready!")
-                    return True
-                elif status == "creating":
-                    elapsed = int(time.time() - start_time)
-                    remaining = max_wait_time - elapsed
-                    logging.info(
-                        f"Database still creating (elapsed: {elapsed}s, remaining: {remaining}s). Waiting 60 seconds..."
-                    )
-                    time.sleep(60)
-                elif status == "error":
-                    logging.error("Database creation failed with error status")
-                    return False
-                else:
-                    elapsed = int(time.time() - start_time)
-                    remaining = max_wait_time - elapsed
-                    logging.info(
-                        f"Database status: {status} (elapsed: {elapsed}s, remaining: {remaining}s). Waiting 60 seconds..."
-                    )
-                    time.sleep(60)
+            if status == "online":
+                logging.info("Database is ready!")
+                return True
+            if status == "error":
+                logging.error("Database creation failed with error status")
+                return False
 
-            except Exception as e:
-                logging.warning(
-                    f"Error checking database status: {e}. Waiting 60 seconds..."
-                )
-                time.sleep(60)
+            elapsed = int(time.time() - start_time)
+            remaining = max_wait_time - elapsed
+            logging.info(
+                f"Database status: {status} (elapsed: {elapsed}s, remaining: {remaining}s). Retrying..."
+            )
+            return None
 
-        logging.error(f"Database did not become ready within {max_wait_time} seconds")
-        return False
+        ready = wait_until(
+            _check_database_status, initial=5.0, max_delay=60.0, timeout=max_wait_time
+        )
+        if ready is None:
+            logging.error(
+                f"Database did not become ready within {max_wait_time} seconds"
+            )
+            return False
+        return ready
 
 
 # Deployment class for the agent using Pydo
 class AgentDeployer:
     def __init__(self, token: str):
-        self.client = pydo.Client(token=token)
+        self.token = token
+        self.client = _pydo_client(token)
+        self._genai = self.client.genai
 
     def _list_models(self):
-        return self.client.genai.list_models()
+        return self._genai.list_models()
+
+    def _wait_agent_exists(self, agent_uuid: str, timeout: int = 30):
+        # Poll until the agent can be fetched, which means it can accept update and attach requests
+        def _agent_exists():
+            try:
+                self._genai.get_agent(agent_uuid)
+                return True
+            except Exception as e:
+                logging.info(f"Agent {agent_uuid} is not available yet: {e}")
+                return None
+
+        if wait_until(_agent_exists, initial=0.5, max_delay=5.0, timeout=timeout):
+            return True
+        logging.warning(
+            f"Agent {agent_uuid} was not available after {timeout} seconds. Continuing anyway..."
+        )
+        return False
 
     def deploy_kb(self, config: KBConfig):
         logging.info("Creating knowledge base with config:")
         config_dict = config.to_dict()
-        logging.info(f"KB config: {config_dict}")
+        logging.info("KB config: %s", config_dict)
 
-        kb_deployment = self.client.genai.create_knowledge_base(body=config_dict)
-        logging.info(f"Knowledge base creation response: {kb_deployment}")
+        kb_deployment = self._genai.create_knowledge_base(body=config_dict)
+        logging.info("Knowledge base creation response: %s", _short(kb_deployment))
         return kb_deployment
 
     def index_kb(self, kb_uuid: str):
@@ -272,21 +479,21 @@ class AgentDeployer:
             "data_source_uuids": [],  # Use all datasources
             "knowledge_base_uuid": kb_uuid,
         }
-        logging.info(f"Indexing job body: {indexing_body}")
+        logging.info("Indexing job body: %s", indexing_body)
 
-        kb_indexing = self.client.genai.create_indexing_job(body=indexing_body)
-        logging.info(f"Indexing job creation response: {kb_indexing}")
+        kb_indexing = self._genai.create_indexing_job(body=indexing_body)
+        logging.info("Indexing job creation response: %s", _short(kb_indexing))
         return kb_indexing
 
     def _deploy_agent(self, config: AgentConfig):
         logging.info("Creating agent with config:")
         config_dict = config.to_dict()
-        logging.info(f"Agent config: {config_dict}")
+        logging.info("Agent config: %s", config_dict)
 
-        deployment = self.client.genai.create_agent(
+        deployment = self._genai.create_agent(
             body=config_dict,
         )
-        logging.info(f"Agent creation response: {deployment}")
+        logging.info("Agent creation response: %s", _short(deployment))
         return deployment
 
     def create_template_agent(
@@ -297,6 +504,8 @@ class AgentDeployer:
         agent_name: Optional[str] = AGENT_NAME,
         model_uuid: Optional[str] = LLAMA_3_3_70B_UUID,
     ):
+        from agent.prompts import SYSTEM_PROMPT_TEMPLATE
+
         system_instructions = SYSTEM_PROMPT_TEMPLATE
         # Create the config
         config = AgentConfig(
@@ -321,25 +530,30 @@ class AgentDeployer:
             "k": 10,
             "max_tokens": 1024,
         }
-        logging.info(f"Retrieval update body: {retrieval_body}")
+        logging.info("Retrieval update body: %s", retrieval_body)
 
-        result = self.client.genai.update_agent(
+        result = self._genai.update_agent(
             uuid=agent_id,
             body=retrieval_body,
         )
-        logging.info(f"Agent retrieval update response: {result}")
+        logging.info("Agent retrieval update response: %s", _short(result))
         return result
 
-    def _add_tool_to_agent(self, agent_uuid: str, function_config: AgentFunctionConfig):
-        # Add tools to the agent using pydo
+    async def _add_tool_to_agent(
+        self, session, agent_uuid: str, function_config: AgentFunctionConfig
+    ):
+        # Same request as pydo's attach_agent_function, sent on the shared aiohttp session
         try:
             logging.info(
                 f"Adding tool {function_config.function_name} to agent {agent_uuid}"
             )
-            logging.info(f"Tool config: {function_config.to_dict()}")
-            self.client.genai.attach_agent_function(
-                agent_uuid=agent_uuid, body=function_config.to_dict()
-            )
+            logging.info("Tool config: %s", function_config.to_dict())
+            async with session.post(
+                f"{DO_API_URL}/v2/gen-ai/agents/{agent_uuid}/functions",
+                json=function_config.to_dict(),
+            ) as response:
+                response.raise_for_status()
+                await response.json()
             logging.info(
                 f"Tool {function_config.function_name} added to agent {agent_uuid} successfully."
             )
@@ -350,6 +564,21 @@ class AgentDeployer:
             raise
 
     def add_tools_to_agent(self, agent_id: str, namespace: str):
+        from agent.tool_schemas import (
+            LIST_FILES_TOOL_DESCRIPTION,
+            LIST_FILES_INPUT_SCHEMA,
+            LIST_FILES_OUTPUT_SCHEMA,
+            LOAD_CSV_TOOL_DESCRIPTION,
+            LOAD_CSV_INPUT_SCHEMA,
+            LOAD_CSV_OUTPUT_SCHEMA,
+            GET_COLUMN_INFO_TOOL_DESCRIPTION,
+            GET_COLUMN_INFO_INPUT_SCHEMA,
+            GET_COLUMN_INFO_OUTPUT_SCHEMA,
+            EXECUTE_PANDAS_CODE_TOOL_DESCRIPTION,
+            EXECUTE_PANDAS_CODE_INPUT_SCHEMA,
+            EXECUTE_PANDAS_CODE_OUTPUT_SCHEMA,
+        )
+
         # Add the four remaining tools
         tools = [
             (
@@ -382,11 +611,8 @@ class AgentDeployer:
             f"Adding {len(tools)} tools to agent {agent_id} in namespace {namespace}"
         )
 
-        for i, (function_name, description, input_schema, output_schema) in enumerate(
-            tools, 1
-        ):
-            logging.info(f"Processing tool {i}/{len(tools)}: {function_name}")
-            tool_config = AgentFunctionConfig(
+        tool_configs = [
+            AgentFunctionConfig(
                 agent_uuid=agent_id,
                 description=description,
                 faas_name=f"data-analysis-agent-tools/{function_name}",
@@ -395,51 +621,84 @@ class AgentDeployer:
                 input_schema=input_schema,
                 output_schema=output_schema,
             )
-            self._add_tool_to_agent(agent_id, tool_config)
+            for function_name, description, input_schema, output_schema in tools
+        ]
+
+        # Each attach is an independent API call, so they are sent concurrently over one connection pool
+        async def _attach_all():
+            import aiohttp
+
+            async with aiohttp.ClientSession(
+                headers={"Authorization": f"Bearer {self.token}"}
+            ) as session:
+                await asyncio.gather(
+                    *[
+                        self._add_tool_to_agent(session, agent_id, tool_config)
+                        for tool_config in tool_configs
+                    ]
+                )
+
+        asyncio.run(_attach_all())
 
 
 class FunctionDeployer:
     def __init__(self, token: str, context: str = "default"):
         self.token = token
         self.context = context
-        self.client = pydo.Client(token=token)
+        self.client = _pydo_client(token)
+        self._functions = self.client.functions
 
     def create_namespace(self, namespace: str, region: str):
         # Create a new namespace for the functions
         try:
-            fn_namespace = self.client.functions.create_namespace(
+            fn_namespace = self._functions.create_namespace(
                 body={"label": namespace, "region": region}
             )
-            logging.info("Waiting for namespace creation.")
-            time.sleep(10)
+            namespace_id = fn_namespace.get("namespace", {}).get("namespace")
+            if namespace_id:
+                logging.info("Waiting for namespace creation.")
+                self._wait_namespace_ready(namespace_id)
             return fn_namespace
         except Exception as e:
             logging.error(f"Error creating namespace '{namespace}': {e}")
             raise
 
-    def _login_doctl(self):
-        command = [
-            "doctl",
-            "auth",
-            "init",
-            "-t",
-            self.token,
-            "--context",
-            self.context,
-            "--interactive",
-            "false",
-        ]
-        try:
-            result = subprocess.run(command, capture_output=True, text=True, check=True)
-            if result.returncode == 0:
-                logging.info("doctl login successful")
-            else:
-                logging.error(f"Error logging in to doctl: {result.stderr}")
-                raise Exception(f"doctl login failed: {result.stderr}")
-        except subprocess.CalledProcessError as e:
-            logging.error(f"doctl login failed: {e.stderr}")
-            raise Exception(f"doctl login failed: {e.stderr}")
+    def _wait_namespace_ready(self, namespace_id: str, timeout: int = 30):
+        # Poll until the namespace can be fetched, so doctl can connect to it
+        def _namespace_exists():
+            try:
+                self._functions.get_namespace(namespace_id)
+                return True
+            except Exception as e:
+                logging.info(f"Namespace {namespace_id} is not available yet: {e}")
+                return None
 
+        if wait_until(_namespace_exists, initial=0.5, max_delay=5.0, timeout=timeout):
+            return True
+        logging.warning(
+            f"Namespace {namespace_id} was not available after {timeout} seconds. Continuing anyway..."
+        )
+        return False
+
+    def _run_doctl(self, command: list) -> tuple:
+        # Stream doctl output as it is produced instead of buffering it until the process exits
+        # Only the last few lines are kept, so they can be included in the error if the command fails
+        output_tail = collections.deque(maxlen=20)
+        with subprocess.Popen(
+            command,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            bufsize=1,
+        ) as process:
+            for line in process.stdout:
+                line = line.rstrip()
+                logging.info("doctl: %s", line)
+                output_tail.append(line)
+        return process.returncode, "\n".join(output_tail)
+
+    # doctl is only used for the serverless connect and deploy steps, which have no pydo equivalent
+    # The token is passed to connect directly, so a separate `doctl auth init` is not needed
     def _connect_doctl_serverless(self, namespace: str):
         command = [
             "doctl",
@@ -448,18 +707,15 @@ class FunctionDeployer:
             namespace,
             "-t",
             self.token,
+            "--context",
+            self.context,
         ]
-        try:
-            result = subprocess.run(command, capture_output=True, text=True, check=True)
-            logging.info(f"Doctl output:{result.stdout}")
-            if result.returncode == 0:
-                logging.info("doctl serverless connection successful")
-            else:
-                logging.error(f"Error connecting to serverless doctl: {result.stderr}")
-                raise Exception(f"doctl serverless connect failed: {result.stderr}")
-        except subprocess.CalledProcessError as e:
-            logging.error(f"doctl serverless connection failed: {e.stderr}")
-            raise Exception(f"doctl serverless connect failed: {e.stderr}")
+        returncode, output = self._run_doctl(command)
+        if returncode == 0:
+            logging.info("doctl serverless connection successful")
+        else:
+            logging.error(f"Error connecting to serverless doctl: {output}")
+            raise Exception(f"doctl serverless connect failed: {output}")
 
     def _deploy_doctl_serverless(self, fn_dir: str):
         command = [
@@ -468,37 +724,56 @@ class FunctionDeployer:
             "deploy",
             fn_dir,
         ]
-        try:
-            result = subprocess.run(command, capture_output=True, text=True, check=True)
-            logging.info(f"Doctl output:{result.stdout}")
-            if result.returncode == 0:
-                logging.info("doctl deploy successful")
-            else:
-                logging.error(f"Error deploying to doctl serverless: {result.stderr}")
-                raise Exception(f"doctl serverless deploy failed: {result.stderr}")
-        except subprocess.CalledProcessError as e:
-            logging.error(f"doctl serverless failed: {e.stderr}")
-            raise Exception(f"doctl serverless deploy failed: {e.stderr}")
+        returncode, output = self._run_doctl(command)
+        if returncode == 0:
+            logging.info("doctl deploy successful")
+        else:
+            logging.error(f"Error deploying to doctl serverless: {output}")
+            raise Exception(f"doctl serverless deploy failed: {output}")
 
     def _copy_tools_to_temp(self) -> str:
         temp_dir = tempfile.mkdtemp()
         dest = os.path.join(temp_dir, "tools")
-        shutil.copytree("./tools", dest)
+        # Any existing .env is skipped so the fresh one written later never truncates a hardlinked source file
+        ignore = shutil.ignore_patterns(
+            "__pycache__", "*.pyc", ".git", ".env", "node_modules"
+        )
+        try:
+            # Hardlinks avoid copying file contents when the temp dir is on the same filesystem
+            shutil.copytree("./tools", dest, copy_function=os.link, ignore=ignore)
+        except (shutil.Error, OSError) as e:
+            # Hardlinks can't cross filesystems (EXDEV), so fall back to a regular copy
+            logging.info(f"Could not hardlink tools ({e}). Copying instead...")
+            shutil.rmtree(dest, ignore_errors=True)
+            shutil.copytree("./tools", dest, ignore=ignore)
         return dest
 
     def _export_secrets_to_env(self, tools_path: str, spaces_config: dict):
         # Create an initial .env to create access tokens for the tools
-        with open(f"{tools_path}/.env", "w") as f:
-            f.write(f"LIST_FILES_TOKEN={secrets.token_urlsafe(16)}\n")
-            f.write(f"LOAD_CSV_TOKEN={secrets.token_urlsafe(16)}\n")
-            f.write(f"GET_COLUMN_INFO_TOKEN={secrets.token_urlsafe(16)}\n")
-            f.write(f"EXECUTE_PANDAS_CODE_TOKEN={secrets.token_urlsafe(16)}\n")
-            f.write(f"SPACES_ACCESS_KEY={spaces_config['access_key']}\n")
-            f.write(f"SPACES_SECRET_KEY={spaces_config['secret_key']}\n")
-            f.write(f"SPACES_BUCKET={spaces_config['bucket_name']}\n")
-            f.write(f"SPACES_REGION={spaces_config['region']}\n")
-
-    def deploy_functions(self, namespace: str, region: str, spaces_config: dict):
+        list_files_token, load_csv_token, column_info_token, pandas_code_token = (
+            _generate_tokens(4)
+        )
+        payload = "".join(
+            [
+                f"LIST_FILES_TOKEN={list_files_token}\n",
+                f"LOAD_CSV_TOKEN={load_csv_token}\n",
+                f"GET_COLUMN_INFO_TOKEN={column_info_token}\n",
+                f"EXECUTE_PANDAS_CODE_TOKEN={pandas_code_token}\n",
+                f"SPACES_ACCESS_KEY={spaces_config['access_key']}\n",
+                f"SPACES_SECRET_KEY={spaces_config['secret_key']}\n",
+                f"SPACES_BUCKET={spaces_config['bucket_name']}\n",
+                f"SPACES_REGION={spaces_config['region']}\n",
+            ]
+        ).encode()
+        # Write the file in one call, readable only by the current user since it holds secrets
+        fd = os.open(f"{tools_path}/.env", os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        try:
+            os.write(fd, payload)
+        finally:
+            os.close(fd)
+
+    def prepare_namespace(self, namespace: str, region: str) -> str:
+        # Creates the namespace. This does not depend on the agent, so it can run alongside other deployment steps
         fn_namespace = self.create_namespace(namespace, region)
         try:
             namespace_id = fn_namespace.get("namespace", {}).get("namespace")
@@ -510,7 +785,18 @@ class FunctionDeployer:
             logging.error(f"Error creating namespace '{namespace}': {e}")
             raise
 
-        self._login_doctl()
+        return namespace_id
+
+    def deploy_functions(
+        self,
+        namespace: str,
+        region: str,
+        spaces_config: dict,
+        namespace_id: Optional[str] = None,
+    ):
+        if namespace_id is None:
+            namespace_id = self.prepare_namespace(namespace, region)
+
         temp_fn_dir = self._copy_tools_to_temp()
         self._export_secrets_to_env(temp_fn_dir, spaces_config)
         self._connect_doctl_serverless(namespace_id)
@@ -535,6 +821,7 @@ def deploy_data_analysis_agent_template(
 ):
     try:
         agent_deployer = AgentDeployer(token)
+        function_deployer = FunctionDeployer(token=token, context="default")
 
         # First, create a new spaces bucket for the data
         logging.info("Initializing Spaces deployer...")
@@ -550,115 +837,145 @@ def deploy_data_analysis_agent_template(
             f"Spaces deployer created for bucket: {bucket_name} in region: {region}"
         )
 
-        # Next create a bucket, upload the data to the bucket
-        logging.info("Creating a new bucket...")
-        spaces_deployer.create_bucket()
-        logging.info(f"Bucket created successfully: {bucket_name}")
+        def _create_bucket_and_upload():
+            # Next create a bucket, upload the data to the bucket
+            logging.info("Creating a new bucket...")
+            spaces_deployer.create_bucket()
+            logging.info(f"Bucket created successfully: {bucket_name}")
 
-        logging.info("Uploading data to bucket..")
-        spaces_deployer.upload_folder_to_space(data_path)
-        logging.info(f"Data uploaded successfully from path: {data_path}")
+            logging.info("Uploading data to bucket..")
+            spaces_deployer.upload_folder_to_space(data_path)
+            logging.info(f"Data uploaded successfully from path: {data_path}")
 
-        # With the bucket created, instantiate a new KB
-        logging.info("Creating knowledge base configuration...")
-        kb_config = KBConfig(
-            name=kb_name,
-            project_id=project_id,
-            spaces_bucket=bucket_name,
-            region=region,
-            embedding_model_uuid=embedding_model,
-            database_id=database_id,
-        )
-        logging.info(f"KB config created: {kb_config.to_dict()}")
-
-        logging.info("Deploying knowledge base..")
-        kb_deployment = agent_deployer.deploy_kb(kb_config)
-
-        logging.info(f"KB deployment response: {kb_deployment}")
-        kb_uuid = kb_deployment.get("knowledge_base", {}).get("uuid")
-        kb_database_id = kb_deployment.get("knowledge_base", {}).get("database_id")
-        logging.info(f"Extracted KB UUID: {kb_uuid}")
-        logging.info(f"Extracted KB Database ID: {kb_database_id}")
+        def _index_kb_when_ready(kb_uuid: str, kb_database_id: str):
+            # Check if we need to wait for database to be ready
+            if database_id is None:
+                # New database was created, wait for it to be ready
+                logging.info(
+                    "New database was created. Waiting for database to be ready..."
+                )
+                if not spaces_deployer.wait_for_database_ready(kb_database_id):
+                    logging.error(
+                        "Database did not become ready. Proceeding without indexing..."
+                    )
+                else:
+                    logging.info("Database is ready. Proceeding with indexing...")
+            else:
+                # Existing database was used
+                logging.info("Existing database was used. Proceeding with indexing...")
 
-        # Check if we need to wait for database to be ready
-        if database_id is None:
-            # New database was created, wait for it to be ready
+            # Create indexing job
             logging.info(
-                "New database was created. Waiting for database to be ready..."
+                "Creating indexing job on the KB. This may take a few seconds..."
             )
-            if not spaces_deployer.wait_for_database_ready(kb_database_id):
-                logging.error(
-                    "Database did not become ready. Proceeding without indexing..."
+            try:
+                logging.info(f"Starting indexing process for KB UUID: {kb_uuid}")
+                agent_deployer.index_kb(kb_uuid)
+                logging.info("Indexing job created successfully.")
+            except Exception as e:
+                logging.warning(
+                    f"Failed to create indexing job: {e}. Agent will still be created but may not have indexed data."
                 )
-            else:
-                logging.info("Database is ready. Proceeding with indexing...")
-        else:
-            # Existing database was used
-            logging.info("Existing database was used. Proceeding with indexing...")
+                logging.warning(f"Indexing error details: {str(e)}")
+
+        # Independent steps run concurrently so their wait times overlap
+        with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
+            # The bucket upload and the functions namespace do not depend on each other
+            upload_future = executor.submit(_create_bucket_and_upload)
+            namespace_future = executor.submit(
+                function_deployer.prepare_namespace, namespace_label, region
+            )
+            done, _ = concurrent.futures.wait(
+                [upload_future, namespace_future],
+                return_when=concurrent.futures.FIRST_EXCEPTION,
+            )
+            for future in done:
+                future.result()
+            namespace_id = namespace_future.result()
+
+            # With the bucket created, instantiate a new KB
+            logging.info("Creating knowledge base configuration...")
+            kb_config = KBConfig(
+                name=kb_name,
+                project_id=project_id,
+                spaces_bucket=bucket_name,
+                region=region,
+                embedding_model_uuid=embedding_model,
+                database_id=database_id,
+            )
+            logging.info("KB config created: %s", kb_config.to_dict())
 
-        # Create indexing job
-        logging.info("Creating indexing job on the KB. This may take a few seconds...")
-        try:
-            logging.info(f"Starting indexing process for KB UUID: {kb_uuid}")
-            agent_deployer.index_kb(kb_uuid)
-            logging.info("Indexing job created successfully.")
-        except Exception as e:
-            logging.warning(
-                f"Failed to create indexing job: {e}. Agent will still be created but may not have indexed data."
+            logging.info("Deploying knowledge base..")
+            kb_deployment = agent_deployer.deploy_kb(kb_config)
+
+            logging.info("KB deployment response: %s", _short(kb_deployment))
+            kb_uuid = kb_deployment.get("knowledge_base", {}).get("uuid")
+            kb_database_id = kb_deployment.get("knowledge_base", {}).get("database_id")
+            logging.info(f"Extracted KB UUID: {kb_uuid}")
+            logging.info(f"Extracted KB Database ID: {kb_database_id}")
+
+            # The agent only needs the KB UUID, so it is deployed while the KB database gets ready for indexing
+            index_future = executor.submit(
+                _index_kb_when_ready, kb_uuid, kb_database_id
             )
-            logging.warning(f"Indexing error details: {str(e)}")
 
-        logging.info("Deploying agent...")
-        agent_deployment = agent_deployer.create_template_agent(
-            project_id=project_id,
-            knowledge_base_uuid=kb_uuid,
-            region=region,
-            agent_name=agent_name,
-            model_uuid=model_uuid,
-        )
-        logging.info(f"Agent deployment response: {agent_deployment}")
-        agent_uuid = agent_deployment.get("agent", {}).get("uuid")
-        logging.info(f"Extracted agent UUID: {agent_uuid}")
+            logging.info("Deploying agent...")
+            agent_deployment = agent_deployer.create_template_agent(
+                project_id=project_id,
+                knowledge_base_uuid=kb_uuid,
+                region=region,
+                agent_name=agent_name,
+                model_uuid=model_uuid,
+            )
+            logging.info("Agent deployment response: %s", _short(agent_deployment))
+            agent_uuid = agent_deployment.get("agent", {}).get("uuid")
+            logging.info(f"Extracted agent UUID: {agent_uuid}")
 
-        # The API to create an agent does not yet support specifying retrieval options
-        # To set the retrieval options to improve query performance, we use the update API
+            # The API to create an agent does not yet support specifying retrieval options
+            # To set the retrieval options to improve query performance, we use the update API
 
-        logging.info(
-            "Updating agent retrieval settings. This may take a few seconds..."
-        )
+            logging.info(
+                "Updating agent retrieval settings. This may take a few seconds..."
+            )
 
-        # Sending an update request immediately after creating an agent may cause errors
-        # However, an update request does not require the agent to finish deployment
-        # As such, instead of waiting for deployment to finish, which can take some time, we simply wait for a few seconds
+            # Sending an update request immediately after creating an agent may cause errors
+            # However, an update request does not require the agent to finish deployment
+            # As such, instead of waiting for deployment to finish, which can take some time, we only wait until the agent can be fetched
 
-        time.sleep(10)
-        agent_deployer.update_agent_retrieval(agent_uuid)
+            agent_deployer._wait_agent_exists(agent_uuid)
+            agent_deployer.update_agent_retrieval(agent_uuid)
 
-        # Deploy FaaS functions for CSV analysis tools
-        logging.info("Deploying FaaS functions for CSV analysis tools...")
-        function_deployer = FunctionDeployer(token=token, context="default")
-        logging.info("Function deployer created successfully")
+            # Deploy FaaS functions for CSV analysis tools
+            logging.info("Deploying FaaS functions for CSV analysis tools...")
 
-        spaces_config = {
-            "access_key": spaces_deployer.access_key,
-            "secret_key": spaces_deployer.secret_key,
-            "bucket_name": spaces_deployer.bucket_name,
-            "region": region,
-        }
+            spaces_config = {
+                "access_key": spaces_deployer.access_key,
+                "secret_key": spaces_deployer.secret_key,
+                "bucket_name": spaces_deployer.bucket_name,
+                "region": region,
+            }
 
-        namespace_id = function_deployer.deploy_functions(
-            namespace=namespace_label, region=region, spaces_config=spaces_config
-        )
-        logging.info(
-            f"FaaS functions deployed successfully in namespace: {namespace_id}"
-        )
+            namespace_id = function_deployer.deploy_functions(
+                namespace=namespace_label,
+                region=region,
+                spaces_config=spaces_config,
+                namespace_id=namespace_id,
+            )
+            logging.info(
+                f"FaaS functions deployed successfully in namespace: {namespace_id}"
+            )
+
+            # Attach tools to agent
+            logging.info("Attaching CSV analysis tools to agent...")
+            # Make sure the agent is available before attaching tools
+            agent_deployer._wait_agent_exists(agent_uuid)
+            agent_deployer.add_tools_to_agent(
+                agent_id=agent_uuid, namespace=namespace_id
+            )
+            logging.info("CSV analysis tools attached to agent successfully.")
 
-        # Attach tools to agent
-        logging.info("Attaching CSV analysis tools to agent...")
-        # Add a delay to ensure the agent is fully ready before attaching tools
-        time.sleep(5)
-        agent_deployer.add_tools_to_agent(agent_id=agent_uuid, namespace=namespace_id)
-        logging.info("CSV analysis tools attached to agent successfully.")
+            # Indexing errors are logged as warnings, so this only waits for the job to be created
+            index_future.result()
 
         logging.info("=" * 60)
         logging.info("🎉 DATA ANALYSIS AGENT DEPLOYMENT COMPLETED SUCCESSFULLY! 🎉")
@@ -0,0 +1,173 @@
+# Shared Spaces access for the data analysis tools
+# Each function pulls this file in through its .include, so it is deployed next to __main__.py
+# pandas, pyarrow and boto3 are imported where they are first used, so importing this module
+# (as list_files does) doesn't pay for libraries that aren't needed
+import os
+import functools
+import collections
+import concurrent.futures
+import io
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Parsed DataFrames are kept per process and reused while the object's ETag is unchanged
+_DF_CACHE = collections.OrderedDict()
+_DF_CACHE_SIZE = 4
+
+
+def get_spaces_config():
+    # Returns (bucket, region, access key, secret key) from the environment, or None if any is missing
+    access_key = os.getenv("SPACES_ACCESS_KEY")
+    secret_key = os.getenv("SPACES_SECRET_KEY")
+    bucket_name = os.getenv("SPACES_BUCKET")
+    region = os.getenv("SPACES_REGION")
+
+    logger.debug(f"Spaces config - Bucket: {bucket_name}, Region: {region}")
+    logger.debug(f"Access key present: {bool(access_key)}")
+    logger.debug(f"Secret key present: {bool(secret_key)}")
+
+    if not all([access_key, secret_key, bucket_name, region]):
+        return None
+    return bucket_name, region, access_key, secret_key
+
+
+# The client is kept for the life of the process, so warm invocations reuse its connection pool
+@functools.lru_cache(maxsize=1)
+def _create_s3_client(region: str, access_key: str, secret_key: str):
+    import boto3
+    import botocore.config
+
+    # The pool is sized for the parallel range downloads, and keepalive keeps idle sockets open between invocations
+    config = botocore.config.Config(
+        max_pool_connections=64,
+        retries={"mode": "adaptive", "max_attempts": 5},
+        tcp_keepalive=True,
+        read_timeout=60,
+    )
+    session = boto3.session.Session()
+    return session.client(
+        "s3",
+        region_name=region,
+        endpoint_url=f"https://{region}.digitaloceanspaces.com",
+        aws_access_key_id=access_key,
+        aws_secret_access_key=secret_key,
+        config=config,
+    )
+
+
+def get_s3_client(config):
+    bucket_name, region, access_key, secret_key = config
+    return _create_s3_client(region, access_key, secret_key)
+
+
+# Large objects are fetched as concurrent byte ranges, since a single GET is limited to one connection's throughput
+def download_bytes(
+    s3_client, bucket, key, head=None, part_size=8 * 1024 * 1024, max_workers=16
+):
+    if head is None:
+        head = s3_client.head_object(Bucket=bucket, Key=key)
+    size = head["ContentLength"]
+    if size <= part_size:
+        return s3_client.get_object(Bucket=bucket, Key=key)["Body"].read()
+
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+
+    def _fetch_range(start):
+        end = min(start + part_size, size) - 1
+        # IfMatch makes sure every range comes from the same version of the object
+        response = s3_client.get_object(
+            Bucket=bucket, Key=key, Range=f"bytes={start}-{end}", IfMatch=head["ETag"]
+        )
+        view[start : end + 1] = response["Body"].read()
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        list(executor.map(_fetch_range, range(0, size, part_size)))
+    return buffer
+
+
+@functools.lru_cache(maxsize=1)
+def _pyarrow():
+    # Returns (pyarrow, pyarrow.csv), or None if pyarrow isn't installed
+    try:
+        import pyarrow
+        import pyarrow.csv
+    except ImportError:
+        return None
+    return pyarrow, pyarrow.csv
+
+
+def _parse_csv(csv_bytes, columns=None):
+    import pandas as pd
+
+    arrow = _pyarrow()
+    if arrow is not None:
+        pa, pa_csv = arrow
+        read_options = pa_csv.ReadOptions(use_threads=True, block_size=8 << 20)
+        # open_csv only reads the first block, which is enough for the header and the
+        # inferred types, since read_csv infers them from the same block
+        schema = pa_csv.open_csv(
+            pa.BufferReader(csv_bytes), read_options=read_options
+        ).schema
+        if columns is not None and not all(
+            column in schema.names for column in columns
+        ):
+            return pd.DataFrame(columns=schema.names)
+        # Date and time columns are kept as strings like pandas does. As Arrow timestamps they
+        # can't be JSON-encoded by the runtime, and .str code in the analysis breaks on them
+        column_types = {
+            field.name: pa.string()
+            for field in schema
+            if pa.types.is_temporal(field.type)
+        }
+        # Arrow's multithreaded reader is much faster than pandas' parser on large files.
+        # It infers the types from the first block only, so a column that changes type later
+        # in the file fails the read, and that file is parsed by pandas below instead
+        try:
+            table = pa_csv.read_csv(
+                pa.BufferReader(csv_bytes),
+                read_options=read_options,
+                convert_options=pa_csv.ConvertOptions(
+                    include_columns=columns, column_types=column_types
+                ),
+            )
+        except pa.ArrowInvalid as e:
+            logger.debug(f"Arrow couldn't parse the CSV, falling back to pandas: {e}")
+        else:
+            return table.to_pandas(types_mapper=pd.ArrowDtype)
+
+    # pandas decodes the bytes in its C parser, so the CSV is never held as a Python str
+    if columns is not None:
+        header = pd.read_csv(io.BytesIO(csv_bytes), encoding="utf-8", nrows=0).columns
+        if not all(column in header for column in columns):
+            return pd.DataFrame(columns=header)
+    # low_memory=False infers each column's dtype from the whole file instead of per chunk,
+    # which avoids mixed-type object columns
+    return pd.read_csv(
+        io.BytesIO(csv_bytes), encoding="utf-8", usecols=columns, low_memory=False
+    )
+
+
+# Loads a CSV object into a DataFrame. When columns are given only those are materialized,
+# and if any of them doesn't exist an empty DataFrame with the file's header is returned
+def load_dataframe(s3_client, bucket, key, columns=None):
+    head = s3_client.head_object(Bucket=bucket, Key=key)
+    cache_key = (bucket, key, head["ETag"], tuple(columns) if columns else None)
+    df = _DF_CACHE.get(cache_key)
+    if df is not None:
+        _DF_CACHE.move_to_end(cache_key)
+        logger.debug(f"Using cached DataFrame for {key}")
+        return df
+
+    # The size comes from the HEAD response, so nothing is measured on the downloaded data
+    logger.debug(f"Downloading CSV file: {key} ({head['ContentLength']} bytes)")
+    csv_bytes = download_bytes(s3_client, bucket, key, head)
+
+    logger.debug("Loading CSV content into pandas DataFrame...")
+    df = _parse_csv(csv_bytes, columns)
+
+    _DF_CACHE[cache_key] = df
+    if len(_DF_CACHE) > _DF_CACHE_SIZE:
+        _DF_CACHE.popitem(last=False)
+    return df
@@ -1,17 +1,80 @@
-import pandas as pd
-import boto3
-import os
-import io
+import hashlib
+import collections
+import contextlib
 import logging
 from typing import Dict, Any
-import sys
-from io import StringIO
+from spaces_data import get_spaces_config, get_s3_client, load_dataframe
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+# Logging is configured by the functions runtime
 logger = logging.getLogger(__name__)
 
 
+# Builtins available to the submitted code. Built once and shared by every call
+_SAFE_BUILTINS = {
+    "len": len,
+    "str": str,
+    "int": int,
+    "float": float,
+    "bool": bool,
+    "list": list,
+    "dict": dict,
+    "tuple": tuple,
+    "set": set,
+    "min": min,
+    "max": max,
+    "sum": sum,
+    "abs": abs,
+    "round": round,
+    "print": print,
+    "type": type,
+    "isinstance": isinstance,
+}
+
+
+# Compiled snippets are reused across calls, since agents often re-run the same code
+_CODE_CACHE = collections.OrderedDict()
+_CODE_CACHE_SIZE = 64
+
+
+def _compile_code(pandas_code):
+    cache_key = hashlib.blake2b(pandas_code.encode()).digest()
+    cached = _CODE_CACHE.get(cache_key)
+    if cached is not None:
+        _CODE_CACHE.move_to_end(cache_key)
+        return cached
+
+    code = compile(pandas_code, "<pandas_code>", "exec")
+    # The last line is also compiled as an expression, to report its value when nothing is printed
+    last_line = pandas_code.strip().split("\n")[-1].strip()
+    last_expr = None
+    if last_line and not last_line.startswith("#"):
+        try:
+            last_expr = compile(last_line, "<pandas_code>", "eval")
+        except SyntaxError as e:
+            last_expr = e
+
+    cached = _CODE_CACHE[cache_key] = (code, last_line, last_expr)
+    if len(_CODE_CACHE) > _CODE_CACHE_SIZE:
+        _CODE_CACHE.popitem(last=False)
+    return cached
+
+
+# Collects everything written to stdout. Appending to a list avoids the repeated buffer growth of StringIO
+class _OutputCapture:
+    def __init__(self):
+        self.parts = []
+
+    def write(self, text):
+        self.parts.append(text)
+        return len(text)
+
+    def flush(self):
+        pass
+
+    def getvalue(self):
+        return "".join(self.parts)
+
+
 def main(args: Dict[str, Any]) -> Dict[str, Any]:
     """
     Execute pandas code on the loaded CSV data.
@@ -22,20 +85,24 @@ def main(args: Dict[str, Any]) -> Dict[str, Any]:
     Returns:
         Dictionary with the result of the code execution
     """
+    # pandas and numpy are imported here rather than at module level to keep cold starts short
+    import pandas as pd
+    import numpy as np
+
     logger.info("=" * 50)
     logger.info("🐍 EXECUTE_PANDAS_CODE TOOL CALLED")
     logger.info("=" * 50)
-    logger.info(f"Input args: {args}")
+    logger.debug(f"Input args: {args}")
 
     try:
         filename = args.get("filename")
         pandas_code = args.get("pandas_code")
 
-        logger.info(f"Filename: {filename}")
-        logger.info(
+        logger.debug(f"Filename: {filename}")
+        logger.debug(
             f"Pandas code length: {len(pandas_code) if pandas_code else 0} characters"
         )
-        logger.info(
+        logger.debug(
             f"Pandas code preview: {pandas_code[:200] if pandas_code else 'None'}..."
         )
 
@@ -46,126 +113,89 @@ def main(args: Dict[str, Any]) -> Dict[str, Any]:
 
         # Clean up the pandas code to handle escaping issues
         # Replace any escaped quotes with proper quotes
-        logger.info("Cleaning up pandas code...")
+        logger.debug("Cleaning up pandas code...")
         original_code = pandas_code
         pandas_code = pandas_code.replace('\\"', '"').replace("\\'", "'")
         if original_code != pandas_code:
-            logger.info("Code was cleaned (escaped quotes replaced)")
+            logger.debug("Code was cleaned (escaped quotes replaced)")
 
         # Get Spaces credentials from environment
-        logger.info("Getting Spaces credentials from environment...")
-        access_key = os.getenv("SPACES_ACCESS_KEY")
-        secret_key = os.getenv("SPACES_SECRET_KEY")
-        bucket_name = os.getenv("SPACES_BUCKET")
-        region = os.getenv("SPACES_REGION")
+        logger.debug("Getting Spaces credentials from environment...")
+        spaces_config = get_spaces_config()
 
-        logger.info(f"Spaces config - Bucket: {bucket_name}, Region: {region}")
-        logger.info(f"Access key present: {bool(access_key)}")
-        logger.info(f"Secret key present: {bool(secret_key)}")
-
-        if not all([access_key, secret_key, bucket_name, region]):
+        if spaces_config is None:
             error_msg = "Missing Spaces configuration"
             logger.error(f"❌ {error_msg}")
             return {"body": {"success": False, "error": error_msg}}
+        bucket_name = spaces_config[0]
 
         # Create S3 client for Spaces
-        logger.info("Creating S3 client for DigitalOcean Spaces...")
-        session = boto3.session.Session()
-        s3_client = session.client(
-            "s3",
-            region_name=region,
-            endpoint_url=f"https://{region}.digitaloceanspaces.com",
-            aws_access_key_id=access_key,
-            aws_secret_access_key=secret_key,
-        )
-        logger.info("S3 client created successfully")
+        logger.debug("Getting S3 client for DigitalOcean Spaces...")
+        s3_client = get_s3_client(spaces_config)
+        logger.debug("S3 client ready")
 
-        # Download CSV file
-        logger.info(f"Downloading CSV file: {filename}")
-        response = s3_client.get_object(Bucket=bucket_name, Key=filename)
-        csv_content = response["Body"].read().decode("utf-8")
-        logger.info(f"Downloaded {len(csv_content)} characters from {filename}")
-
-        # Load into pandas DataFrame
-        logger.info("Loading CSV content into pandas DataFrame...")
-        df = pd.read_csv(io.StringIO(csv_content))
-        logger.info(f"DataFrame created with shape: {df.shape}")
-        logger.info(f"DataFrame columns: {list(df.columns)}")
+        # Load the CSV file into a pandas DataFrame
+        df = load_dataframe(s3_client, bucket_name, filename)
+        logger.debug(f"DataFrame created with shape: {df.shape}")
+        logger.debug(f"DataFrame columns: {list(df.columns)}")
 
         # Capture stdout to get print statements
-        logger.info("Setting up stdout capture for code execution...")
-        old_stdout = sys.stdout
-        sys.stdout = captured_output = StringIO()
+        logger.debug("Setting up stdout capture for code execution...")
+        captured_output = _OutputCapture()
 
         try:
             # Execute the pandas code
-            logger.info("Executing pandas code...")
-            logger.info(f"Code to execute:\n{pandas_code}")
+            logger.debug("Executing pandas code...")
+            logger.debug(f"Code to execute:\n{pandas_code}")
 
             # The code should use 'df' as the DataFrame variable name
-            local_vars = {"df": df, "pd": pd, "np": __import__("numpy")}
-            logger.info("Local variables prepared: df, pd, np")
-
-            # Add some safety restrictions
-            safe_builtins = {
-                "len": len,
-                "str": str,
-                "int": int,
-                "float": float,
-                "bool": bool,
-                "list": list,
-                "dict": dict,
-                "tuple": tuple,
-                "set": set,
-                "min": min,
-                "max": max,
-                "sum": sum,
-                "abs": abs,
-                "round": round,
-                "print": print,
-                "type": type,
-                "isinstance": isinstance,
-            }
-            logger.info("Safe builtins configured for code execution")
-
-            exec(pandas_code, {"__builtins__": safe_builtins}, local_vars)
-            logger.info("✅ Code executed successfully")
+            # It gets a copy so in-place changes don't leak into the cached DataFrame
+            local_vars = {"df": df.copy()}
+            exec_globals = {"__builtins__": _SAFE_BUILTINS, "pd": pd, "np": np}
+            logger.debug("Variables prepared: df, pd, np")
+
+            code, last_line, last_expr = _compile_code(pandas_code)
+            with contextlib.redirect_stdout(captured_output):
+                exec(code, exec_globals, local_vars)
+            logger.debug("✅ Code executed successfully")
 
             # Get the captured output
             output = captured_output.getvalue()
-            logger.info(f"Captured output length: {len(output)} characters")
+            logger.debug(f"Captured output length: {len(output)} characters")
 
             # If no output was captured, try to get the result from the last expression
             if not output.strip():
-                logger.info("No output captured, trying to evaluate last line...")
+                logger.debug("No output captured, trying to evaluate last line...")
                 # Try to evaluate the last line as an expression
-                lines = pandas_code.strip().split("\n")
-                last_line = lines[-1].strip()
-                logger.info(f"Last line to evaluate: {last_line}")
+                logger.debug(f"Last line to evaluate: {last_line}")
 
-                if last_line and not last_line.startswith("#"):
+                if last_expr is not None:
                     try:
-                        result = eval(
-                            last_line, {"__builtins__": safe_builtins}, local_vars
-                        )
-                        logger.info(
+                        if isinstance(last_expr, SyntaxError):
+                            raise last_expr.with_traceback(None)
+                        with contextlib.redirect_stdout(captured_output):
+                            result = eval(last_expr, exec_globals, local_vars)
+                        logger.debug(
                             f"Last line evaluation successful, result type: {type(result)}"
                         )
 
                         if result is not None:
                             if isinstance(result, pd.DataFrame):
-                                output = f"DataFrame shape: {result.shape}\nColumns: {list(result.columns)}\nFirst 5 rows:\n{result.head().to_string()}"
-                                logger.info(
+                                # iloc slices a view, and the column cap bounds the time spent pretty-printing wide results
+                                preview = result.iloc[:5].to_string(max_cols=20)
+                                output = f"DataFrame shape: {result.shape}\nColumns: {result.columns.tolist()}\nFirst 5 rows:\n{preview}"
+                                logger.debug(
                                     f"Result is DataFrame with shape: {result.shape}"
                                 )
                             elif isinstance(result, pd.Series):
-                                output = f"Series length: {len(result)}\nFirst 10 values:\n{result.head(10).to_string()}"
-                                logger.info(
+                                preview = result.iloc[:10].to_string()
+                                output = f"Series length: {len(result)}\nFirst 10 values:\n{preview}"
+                                logger.debug(
                                     f"Result is Series with length: {len(result)}"
                                 )
                             else:
                                 output = str(result)
-                                logger.info(
+                                logger.debug(
                                     f"Result is {type(result)}: {str(result)[:100]}..."
                                 )
                     except Exception as eval_error:
@@ -174,7 +204,9 @@ def main(args: Dict[str, Any]) -> Dict[str, Any]:
                             f"Last line evaluation failed: {str(eval_error)}"
                         )
             else:
-                logger.info(f"Output captured from print statements: {output[:200]}...")
+                logger.debug(
+                    f"Output captured from print statements: {output[:200]}..."
+                )
 
             result = {"success": True, "result": output}
 
@@ -192,10 +224,6 @@ def main(args: Dict[str, Any]) -> Dict[str, Any]:
             logger.error(f"Error: {error_msg}")
             logger.error("=" * 50)
             return {"body": {"success": False, "error": error_msg}}
-        finally:
-            # Restore stdout
-            logger.info("Restoring stdout...")
-            sys.stdout = old_stdout
 
     except Exception as e:
         error_msg = str(e)
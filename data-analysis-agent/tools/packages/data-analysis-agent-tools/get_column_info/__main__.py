@@ -1,15 +1,19 @@
-import pandas as pd
-import boto3
-import os
-import io
 import logging
 from typing import Dict, Any
+from spaces_data import get_spaces_config, get_s3_client, load_dataframe
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+# Logging is configured by the functions runtime
 logger = logging.getLogger(__name__)
 
 
+def _to_float(value):
+    # Arrow-backed columns return pd.NA where numpy ones return NaN, e.g. the std of a single
+    # value or the min of an empty column, and float() raises on pd.NA
+    import pandas as pd
+
+    return None if pd.isna(value) else float(value)
+
+
 def main(args: Dict[str, Any]) -> Dict[str, Any]:
     """
     Get detailed information about a specific column in the loaded CSV data.
@@ -20,17 +24,20 @@ def main(args: Dict[str, Any]) -> Dict[str, Any]:
     Returns:
         Dictionary with column information
     """
+    # pandas is imported here rather than at module level to keep cold starts short
+    import pandas as pd
+
     logger.info("=" * 50)
     logger.info("📊 GET_COLUMN_INFO TOOL CALLED")
     logger.info("=" * 50)
-    logger.info(f"Input args: {args}")
+    logger.debug(f"Input args: {args}")
 
     try:
         filename = args.get("filename")
         column_name = args.get("column_name")
 
-        logger.info(f"Filename: {filename}")
-        logger.info(f"Column name: {column_name}")
+        logger.debug(f"Filename: {filename}")
+        logger.debug(f"Column name: {column_name}")
 
         if not filename or not column_name:
             error_msg = "Filename and column_name are required"
@@ -38,44 +45,24 @@ def main(args: Dict[str, Any]) -> Dict[str, Any]:
             return {"body": {"success": False, "error": error_msg}}
 
         # Get Spaces credentials from environment
-        logger.info("Getting Spaces credentials from environment...")
-        access_key = os.getenv("SPACES_ACCESS_KEY")
-        secret_key = os.getenv("SPACES_SECRET_KEY")
-        bucket_name = os.getenv("SPACES_BUCKET")
-        region = os.getenv("SPACES_REGION")
+        logger.debug("Getting Spaces credentials from environment...")
+        spaces_config = get_spaces_config()
 
-        logger.info(f"Spaces config - Bucket: {bucket_name}, Region: {region}")
-        logger.info(f"Access key present: {bool(access_key)}")
-        logger.info(f"Secret key present: {bool(secret_key)}")
-
-        if not all([access_key, secret_key, bucket_name, region]):
+        if spaces_config is None:
             error_msg = "Missing Spaces configuration"
             logger.error(f"❌ {error_msg}")
             return {"body": {"success": False, "error": error_msg}}
+        bucket_name = spaces_config[0]
 
         # Create S3 client for Spaces
-        logger.info("Creating S3 client for DigitalOcean Spaces...")
-        session = boto3.session.Session()
-        s3_client = session.client(
-            "s3",
-            region_name=region,
-            endpoint_url=f"https://{region}.digitaloceanspaces.com",
-            aws_access_key_id=access_key,
-            aws_secret_access_key=secret_key,
-        )
-        logger.info("S3 client created successfully")
+        logger.debug("Getting S3 client for DigitalOcean Spaces...")
+        s3_client = get_s3_client(spaces_config)
+        logger.debug("S3 client ready")
 
-        # Download CSV file
-        logger.info(f"Downloading CSV file: {filename}")
-        response = s3_client.get_object(Bucket=bucket_name, Key=filename)
-        csv_content = response["Body"].read().decode("utf-8")
-        logger.info(f"Downloaded {len(csv_content)} characters from {filename}")
-
-        # Load into pandas DataFrame
-        logger.info("Loading CSV content into pandas DataFrame...")
-        df = pd.read_csv(io.StringIO(csv_content))
-        logger.info(f"DataFrame created with shape: {df.shape}")
-        logger.info(f"Available columns: {list(df.columns)}")
+        # Load the CSV file into a pandas DataFrame
+        df = load_dataframe(s3_client, bucket_name, filename, [column_name])
+        logger.debug(f"DataFrame created with shape: {df.shape}")
+        logger.debug(f"Available columns: {list(df.columns)}")
 
         # Check if column exists
         if column_name not in df.columns:
@@ -84,59 +71,67 @@ def main(args: Dict[str, Any]) -> Dict[str, Any]:
             logger.error(f"Available columns: {list(df.columns)}")
             return {"body": {"success": False, "error": error_msg}}
 
-        logger.info(f"✅ Column '{column_name}' found in DataFrame")
+        logger.debug(f"✅ Column '{column_name}' found in DataFrame")
 
         # Get column information
-        logger.info(f"Analyzing column: {column_name}")
+        logger.debug(f"Analyzing column: {column_name}")
         column_series = df[column_name]
 
-        logger.info("Calculating basic column statistics...")
+        logger.debug("Calculating basic column statistics...")
+        # Each of these is a full scan of the column, so every value is computed once and reused
+        total_count = len(column_series)
+        is_numeric = pd.api.types.is_numeric_dtype(column_series)
+        if is_numeric:
+            null_count = int(column_series.isna().sum())
+            unique_count = int(column_series.nunique())
+        else:
+            # A single hashed pass gives the null count, the unique count and the top values
+            value_counts = column_series.value_counts(dropna=False)
+            null_mask = value_counts.index.isna()
+            null_count = int(value_counts[null_mask].sum())
+            value_counts = value_counts[~null_mask]
+            unique_count = len(value_counts)
         column_info = {
             "name": column_name,
             "dtype": str(column_series.dtype),
-            "count": int(column_series.count()),
-            "null_count": int(column_series.isnull().sum()),
-            "null_percentage": float(
-                column_series.isnull().sum() / len(column_series) * 100
+            "count": total_count - null_count,
+            "null_count": null_count,
+            "null_percentage": (
+                float(null_count / total_count * 100) if total_count else 0.0
             ),
-            "unique_count": int(column_series.nunique()),
-            "unique_percentage": float(
-                column_series.nunique() / len(column_series) * 100
+            "unique_count": unique_count,
+            "unique_percentage": (
+                float(unique_count / total_count * 100) if total_count else 0.0
             ),
         }
 
-        logger.info(
+        logger.debug(
             f"Basic stats - Count: {column_info['count']}, Nulls: {column_info['null_count']}, Unique: {column_info['unique_count']}"
         )
 
         # Add type-specific information
-        if pd.api.types.is_numeric_dtype(column_series):
-            logger.info("Column is numeric, calculating statistical measures...")
+        if is_numeric:
+            logger.debug("Column is numeric, calculating statistical measures...")
             column_info.update(
                 {
-                    "min": float(column_series.min())
-                    if not column_series.empty
-                    else None,
-                    "max": float(column_series.max())
-                    if not column_series.empty
-                    else None,
-                    "mean": float(column_series.mean())
-                    if not column_series.empty
-                    else None,
-                    "std": float(column_series.std())
-                    if not column_series.empty
-                    else None,
+                    "min": _to_float(column_series.min()),
+                    "max": _to_float(column_series.max()),
+                    "mean": _to_float(column_series.mean()),
+                    "std": _to_float(column_series.std()),
                 }
             )
-            logger.info(
+            logger.debug(
                 f"Numeric stats - Min: {column_info['min']}, Max: {column_info['max']}, Mean: {column_info['mean']}"
             )
         else:
-            logger.info("Column is non-numeric, calculating value counts...")
+            logger.debug("Column is non-numeric, using value counts...")
             # For non-numeric columns, get value counts
-            value_counts = column_series.value_counts().head(10)
-            column_info["top_values"] = value_counts.to_dict()
-            logger.info(f"Top values: {dict(list(value_counts.head(5).items()))}")
+            top_values = value_counts.head(10)
+            # Keys are stringified so values like timestamps stay JSON-encodable
+            column_info["top_values"] = {
+                str(value): int(count) for value, count in top_values.items()
+            }
+            logger.debug(f"Top values: {dict(list(top_values.head(5).items()))}")
 
         result = {"success": True, "column_info": column_info}
 
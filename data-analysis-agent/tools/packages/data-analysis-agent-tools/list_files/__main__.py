@@ -1,11 +1,10 @@
-import boto3
-import os
 import logging
+import heapq
 from typing import Dict, Any, List
 from datetime import datetime
+from spaces_data import get_spaces_config, get_s3_client
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+# Logging is configured by the functions runtime
 logger = logging.getLogger(__name__)
 
 
@@ -14,7 +13,7 @@ def main(args: Dict[str, Any]) -> Dict[str, Any]:
     List all CSV files available in the Spaces bucket with their metadata.
 
     Args:
-        args: Dictionary (no parameters required)
+        args: Dictionary containing optional 'prefix' and 'max_files' parameters
 
     Returns:
         Dictionary with list of CSV files and their metadata
@@ -22,48 +21,48 @@ def main(args: Dict[str, Any]) -> Dict[str, Any]:
     logger.info("=" * 50)
     logger.info("🔍 LIST_FILES TOOL CALLED")
     logger.info("=" * 50)
-    logger.info(f"Input args: {args}")
+    logger.debug(f"Input args: {args}")
 
     try:
-        # Get Spaces credentials from environment
-        logger.info("Getting Spaces credentials from environment...")
-        access_key = os.getenv("SPACES_ACCESS_KEY")
-        secret_key = os.getenv("SPACES_SECRET_KEY")
-        bucket_name = os.getenv("SPACES_BUCKET")
-        region = os.getenv("SPACES_REGION")
+        prefix = args.get("prefix")
+        max_files = args.get("max_files", None)  # No default limit
+
+        logger.debug(f"Prefix: {prefix}")
+        logger.debug(f"Max files: {max_files}")
 
-        logger.info(f"Spaces config - Bucket: {bucket_name}, Region: {region}")
-        logger.info(f"Access key present: {bool(access_key)}")
-        logger.info(f"Secret key present: {bool(secret_key)}")
+        # Get Spaces credentials from environment
+        logger.debug("Getting Spaces credentials from environment...")
+        spaces_config = get_spaces_config()
 
-        if not all([access_key, secret_key, bucket_name, region]):
+        if spaces_config is None:
             error_msg = "Missing Spaces configuration"
             logger.error(f"❌ {error_msg}")
             return {"body": {"success": False, "error": error_msg}}
+        bucket_name = spaces_config[0]
 
         # Create S3 client for Spaces
-        logger.info("Creating S3 client for DigitalOcean Spaces...")
-        session = boto3.session.Session()
-        s3_client = session.client(
-            "s3",
-            region_name=region,
-            endpoint_url=f"https://{region}.digitaloceanspaces.com",
-            aws_access_key_id=access_key,
-            aws_secret_access_key=secret_key,
-        )
-        logger.info("S3 client created successfully")
-
-        # List objects in the bucket
-        logger.info(f"Listing objects in bucket: {bucket_name}")
-        response = s3_client.list_objects_v2(Bucket=bucket_name)
-        logger.info(f"S3 response keys: {list(response.keys())}")
+        logger.debug("Getting S3 client for DigitalOcean Spaces...")
+        s3_client = get_s3_client(spaces_config)
+        logger.debug("S3 client ready")
+
+        # List objects in the bucket. The paginator follows continuation tokens past the 1000 key limit
+        logger.debug(f"Listing objects in bucket: {bucket_name}")
+        paginator = s3_client.get_paginator("list_objects_v2")
+        paginate_args = {"Bucket": bucket_name, "PaginationConfig": {"PageSize": 1000}}
+        if prefix:
+            paginate_args["Prefix"] = prefix
 
         files = []
-        if "Contents" in response:
-            logger.info(f"Found {len(response['Contents'])} objects in bucket")
-            for obj in response["Contents"]:
+        object_count = 0
+        # Checked once, so the per-object messages cost nothing unless debug logging is on
+        debug = logger.isEnabledFor(logging.DEBUG)
+        for page in paginator.paginate(**paginate_args):
+            contents = page.get("Contents", [])
+            object_count += len(contents)
+            for obj in contents:
                 key = obj["Key"]
-                logger.info(f"Processing object: {key}")
+                if debug:
+                    logger.debug(f"Processing object: {key}")
                 # Only include CSV files
                 if key.lower().endswith(".csv"):
                     file_info = {
@@ -72,15 +71,19 @@ def main(args: Dict[str, Any]) -> Dict[str, Any]:
                         "last_modified": obj["LastModified"].isoformat(),
                     }
                     files.append(file_info)
-                    logger.info(f"✅ Added CSV file: {key} ({obj['Size']} bytes)")
-                else:
-                    logger.info(f"⏭️  Skipped non-CSV file: {key}")
-        else:
-            logger.info("No objects found in bucket")
+                    if debug:
+                        logger.debug(f"✅ Added CSV file: {key} ({obj['Size']} bytes)")
+                elif debug:
+                    logger.debug(f"⏭️  Skipped non-CSV file: {key}")
+        logger.debug(f"Found {object_count} objects in bucket")
 
         # Sort by last modified date (newest first)
-        logger.info(f"Sorting {len(files)} CSV files by last modified date")
-        files.sort(key=lambda x: x["last_modified"], reverse=True)
+        logger.debug(f"Sorting {len(files)} CSV files by last modified date")
+        if max_files is not None:
+            # Only the newest files are needed, so a bounded heap avoids sorting the full list
+            files = heapq.nlargest(max_files, files, key=lambda x: x["last_modified"])
+        else:
+            files.sort(key=lambda x: x["last_modified"], reverse=True)
 
         result = {"success": True, "files": files}
 
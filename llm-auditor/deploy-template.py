@@ -1,8 +1,8 @@
-import pydo
 import os
-from typing import Optional, List
+import base64
+from typing import Optional, List, Callable, TYPE_CHECKING
 import time
-import subprocess
+import concurrent.futures
 from agents.constants import (
     LLAMA_3_3_70B_UUID,
     CRITIC_AGENT_NAME,
@@ -12,40 +12,23 @@ from agents.constants import (
     POLL_FREQUENCY,
     MAX_WAIT_TIME,
 )
-from agents.auditor.prompts import (
-    AUDITOR_PROMPT,
-    CRITIC_DESCRIPTION,
-    CRITIC_INPUT_SCHEMA,
-    CRITIC_OUTPUT_SCHEMA,
-    REVISOR_DESCRIPTION,
-    REVISOR_INPUT_SCHEMA,
-    REVISOR_OUTPUT_SCHEMA,
-)
-from agents.critic.prompts import (
-    CRITIC_PROMPT,
-    SEARCH_DESCRIPTION,
-    SEARCH_INPUT_SCHEMA,
-    SEARCH_OUTPUT_SCHEMA,
-)
-from agents.revisor.prompts import REVISER_PROMPT
-
 from dataclasses import dataclass
-from dotenv import load_dotenv
-import tempfile
-import shutil
-import secrets
 import logging
 import argparse
-import json
 import sys
 
+# pydo, dotenv, the agent prompts and the process/filesystem helpers are imported where they are used,
+# so --help and argument errors don't pay for loading them
+if TYPE_CHECKING:
+    import pydo
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s"
 )
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class AgentConfig:
     agent_name: str
     agent_description: str
@@ -69,13 +52,26 @@ class AgentConfig:
         return config
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class DeployedAgentInfo:
     agent_uuid: str
     agent_url: str
     agent_key: Optional[str] = None
 
 
+def _generate_tokens(count: int, nbytes: int = 16) -> list:
+    # Equivalent to calling secrets.token_urlsafe(nbytes) count times, but with a single urandom call
+    raw = os.urandom(count * nbytes)
+    return [
+        base64.urlsafe_b64encode(raw[i : i + nbytes]).rstrip(b"=").decode("ascii")
+        for i in range(0, len(raw), nbytes)
+    ]
+
+
+def _has_url(agent: dict) -> bool:
+    return bool(agent.get("url") or (agent.get("deployment") or {}).get("url"))
+
+
 def _create_info_from_deployment(deployment: dict, require_url: bool = True):
     agent_deployment = deployment.get("agent", {})
     url = agent_deployment.get("url") or agent_deployment.get("deployment").get("url")
@@ -87,7 +83,7 @@ def _create_info_from_deployment(deployment: dict, require_url: bool = True):
     return DeployedAgentInfo(agent_uuid=uuid, agent_url=url)
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class AgentFunctionConfig:
     agent_uuid: str
     description: str
@@ -109,7 +105,7 @@ class AgentFunctionConfig:
         }
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class DOAuth:
     token: str
     context: str
@@ -117,8 +113,10 @@ class DOAuth:
 
 # Deployment class for the agents using Pydo
 class AgentDeployer:
-    def __init__(self, token: str):
-        self.client = pydo.Client(token=token)
+    def __init__(self, client: "pydo.Client"):
+        self.client = client
+        # The latest get_agent response for each agent, so a successful poll doesn't have to be repeated
+        self._agents = {}
 
     def _deploy_agent(self, config: AgentConfig):
         deployment = self.client.genai.create_agent(
@@ -160,30 +158,46 @@ class AgentDeployer:
             logging.error(f"Error adding tool to agent {agent_uuid}: {e}")
             raise
 
-    def _has_url(self, agent_uuid: str):
-        print(f"Checking status of {agent_uuid}")
-        agent_response = self.client.genai.get_agent(agent_uuid).get("agent")
-        has_url = agent_response.get("url") or agent_response.get("deployment").get(
-            "url"
-        )
-        if has_url:
-            return True
-        return False
+    def _get_agent(self, agent_uuid: str):
+        agent = self.client.genai.get_agent(agent_uuid)
+        self._agents[agent_uuid] = agent
+        return agent
 
-    def _wait_till_ready(
+    def _check_agent(self, agent_uuid: str, is_ready: Callable[[dict], bool]):
+        logging.info(f"Checking status of {agent_uuid}")
+        try:
+            agent_response = self._get_agent(agent_uuid).get("agent", {})
+        except Exception as e:
+            # Newly created agents may briefly not be visible in the API
+            logging.info(f"Agent {agent_uuid} is not available yet: {e}")
+            return False
+        return is_ready(agent_response)
+
+    def _wait_for_agents_ready(
         self,
-        critic_id: str,
-        revisor_id: str,
+        agent_uuids: List[str],
+        is_ready: Callable[[dict], bool],
         poll_frequency: int = POLL_FREQUENCY,
         max_wait_time: int = MAX_WAIT_TIME,
     ):
-        # We need to wait till the critic and revisor are deployed so they have URLs. This is required in order to invoke them downstream as functions later
+        # Polls until is_ready holds for every agent's get_agent response
+        # All agents are checked concurrently, and the interval backs off from 100ms up to poll_frequency
         start_time = time.time()
-        while time.time() - start_time < max_wait_time:
-            logging.info("Polling status of agents..")
-            if self._has_url(critic_id) and self._has_url(revisor_id):
-                return True
-            time.sleep(poll_frequency)
+        interval = 0.1
+        with concurrent.futures.ThreadPoolExecutor(
+            max_workers=len(agent_uuids)
+        ) as executor:
+            while time.time() - start_time < max_wait_time:
+                logging.info("Polling status of agents..")
+                if all(
+                    executor.map(
+                        lambda agent_uuid: self._check_agent(agent_uuid, is_ready),
+                        agent_uuids,
+                    )
+                ):
+                    return True
+                time.sleep(interval)
+                interval = min(interval * 1.5, poll_frequency)
         raise Exception(
             f"Agents did not finish deployment within {max_wait_time} seconds."
         )
@@ -199,58 +213,62 @@ class AgentDeployer:
         reference_kbs: Optional[List[str]] = None,
     ):
         # This function deploys three agents - the main auditor, the critic, and the revisor, and returns the ID of each of them
-        logging.info("Creating auditor agent..")
-        auditor_agent_deployment = self._create_component_agent(
-            project_id=project_id,
-            agent_name=auditor_agent_name,
-            agent_description="The Auditor agent used to check the factual validity of a question and answer pair.",
-            prompt=AUDITOR_PROMPT,
-            region=region,
-            model_uuid=model_uuid,
-        )
-
-        # Next create the critic agent, which may contain knowledge bases for additional context
-        logging.info("Creating Critic Agent...")
-        critic_agent_deployment = self._create_component_agent(
-            project_id=project_id,
-            agent_name=critic_agent_name,
-            agent_description="The Critic sub agent used by the auditor agent.",
-            prompt=CRITIC_PROMPT,
-            region=region,
-            model_uuid=model_uuid,
-            kb_uuids=reference_kbs,
-        )
-
-        # Finally, create the revisor agent
-        logging.info("Creating Revisor Agent...")
-        revisor_agent_deployment = self._create_component_agent(
-            project_id=project_id,
-            agent_name=revisor_agent_name,
-            agent_description="The Revisor sub-agent used by the auditor agent.",
-            prompt=REVISER_PROMPT,
-            region=region,
-            model_uuid=model_uuid,
-        )
-
-        # Sleep for a few seconds
-        time.sleep(10)
+        from agents.auditor.prompts import AUDITOR_PROMPT
+        from agents.critic.prompts import CRITIC_PROMPT
+        from agents.revisor.prompts import REVISER_PROMPT
+
+        # The three agents don't depend on each other, so they are created concurrently
+        logging.info("Creating auditor, critic and revisor agents..")
+        with concurrent.futures.ThreadPoolExecutor(max_workers=3) as executor:
+            auditor_future = executor.submit(
+                self._create_component_agent,
+                project_id=project_id,
+                agent_name=auditor_agent_name,
+                agent_description="The Auditor agent used to check the factual validity of a question and answer pair.",
+                prompt=AUDITOR_PROMPT,
+                region=region,
+                model_uuid=model_uuid,
+            )
+            # The critic agent may contain knowledge bases for additional context
+            critic_future = executor.submit(
+                self._create_component_agent,
+                project_id=project_id,
+                agent_name=critic_agent_name,
+                agent_description="The Critic sub agent used by the auditor agent.",
+                prompt=CRITIC_PROMPT,
+                region=region,
+                model_uuid=model_uuid,
+                kb_uuids=reference_kbs,
+            )
+            revisor_future = executor.submit(
+                self._create_component_agent,
+                project_id=project_id,
+                agent_name=revisor_agent_name,
+                agent_description="The Revisor sub-agent used by the auditor agent.",
+                prompt=REVISER_PROMPT,
+                region=region,
+                model_uuid=model_uuid,
+            )
+            auditor_agent_deployment = auditor_future.result()
+            critic_agent_deployment = critic_future.result()
+            revisor_agent_deployment = revisor_future.result()
 
         auditor_uuid = auditor_agent_deployment.get("agent").get("uuid")
         critic_uuid = critic_agent_deployment.get("agent").get("uuid")
         revisor_uuid = revisor_agent_deployment.get("agent").get("uuid")
 
-        self._wait_till_ready(critic_uuid, revisor_uuid)
+        # We need to wait till the critic and revisor are deployed so they have URLs. This is required in order to invoke them downstream as functions later
+        self._wait_for_agents_ready([critic_uuid, revisor_uuid], _has_url)
+        # The auditor is never invoked as a function, so it only has to be visible in the API
+        self._wait_for_agents_ready([auditor_uuid], lambda agent: True)
 
+        # The final poll already fetched each agent, so those responses are reused
         return {
             "auditor": _create_info_from_deployment(
-                self.client.genai.get_agent(auditor_uuid), require_url=False
-            ),
-            "critic": _create_info_from_deployment(
-                self.client.genai.get_agent(critic_uuid)
-            ),
-            "revisor": _create_info_from_deployment(
-                self.client.genai.get_agent(revisor_uuid)
+                self._agents[auditor_uuid], require_url=False
             ),
+            "critic": _create_info_from_deployment(self._agents[critic_uuid]),
+            "revisor": _create_info_from_deployment(self._agents[revisor_uuid]),
         }
 
     def _enable_api_key(self, deployed_agent_info: DeployedAgentInfo, key_name: str):
@@ -280,10 +298,10 @@ class AgentDeployer:
 
 
 class FunctionDeployer:
-    def __init__(self, token: str, context: str):
+    def __init__(self, client: "pydo.Client", token: str, context: str):
         self.token = token
         self.context = context
-        self.client = pydo.Client(token=token)
+        self.client = client
 
     def create_namespace(self, namespace: str, region: str):
         # Create a new namespace for the functions
@@ -296,30 +314,9 @@ class FunctionDeployer:
             logging.error(f"Error creating namespace '{namespace}': {e}")
             raise
 
-    def _login_doctl(self):
-        command = [
-            "doctl",
-            "auth",
-            "init",
-            "-t",
-            self.token,
-            "--context",
-            self.context,
-            "--interactive",
-            "false",
-        ]
-        try:
-            result = subprocess.run(command, capture_output=True, text=True, check=True)
-            if result.returncode == 0:
-                logging.info("doctl login successful")
-            else:
-                logging.error(f"Error logging in to doctl: {result.stderr}")
-                raise Exception(f"doctl login failed: {result.stderr}")
-        except subprocess.CalledProcessError as e:
-            logging.error(f"doctl login failed: {e.stderr}")
-            raise Exception(f"doctl login failed: {e.stderr}")
-
     def _connect_doctl_serverless(self, namespace: str):
+        import subprocess
+
         command = [
             "doctl",
             "serverless",
@@ -327,6 +324,8 @@ class FunctionDeployer:
             namespace,
             "-t",
             self.token,
+            "--context",
+            self.context,
         ]
         try:
             result = subprocess.run(command, capture_output=True, text=True, check=True)
@@ -341,11 +340,17 @@ class FunctionDeployer:
             raise Exception(f"doctl serverless connect failed: {e.stderr}")
 
     def _deploy_doctl_serverless(self, fn_dir: str):
+        import subprocess
+
         command = [
             "doctl",
             "serverless",
             "deploy",
             fn_dir,
+            "-t",
+            self.token,
+            "--context",
+            self.context,
         ]
         try:
             result = subprocess.run(command, capture_output=True, text=True, check=True)
@@ -360,9 +365,24 @@ class FunctionDeployer:
             raise Exception(f"doctl serverless deploy failed: {e.stderr}")
 
     def _copy_tools_to_temp(self) -> str:
+        import tempfile
+        import shutil
+
         temp_dir = tempfile.mkdtemp()
         dest = os.path.join(temp_dir, "tools")
-        shutil.copytree("./tools", dest)
+        # Files written during the deploy are skipped, so a fresh .env or a build's virtualenv
+        # never writes through a hardlink into the source tree
+        ignore = shutil.ignore_patterns(
+            ".env", "virtualenv", ".deployed", "__pycache__"
+        )
+        try:
+            # Hardlinks avoid copying file contents when the temp dir is on the same filesystem
+            shutil.copytree("./tools", dest, copy_function=os.link, ignore=ignore)
+        except (shutil.Error, OSError) as e:
+            # Hardlinks can't cross filesystems (EXDEV), so fall back to a regular copy
+            logging.info(f"Could not hardlink tools ({e}). Copying instead...")
+            shutil.rmtree(dest, ignore_errors=True)
+            shutil.copytree("./tools", dest, ignore=ignore)
         return dest
 
     def _export_secrets_to_env(
@@ -371,29 +391,29 @@ class FunctionDeployer:
         tavily_api_key: str,
         agent_deployment_dict: dict[str, DeployedAgentInfo],
     ):
-        # Create an .env to create access tokens for the tools and include secrets
-        with open(f"{tools_path}/.env", "w") as f:
+        search_token, critic_token, revisor_token = _generate_tokens(3)
+        critic = agent_deployment_dict.get("critic")
+        revisor = agent_deployment_dict.get("revisor")
+        lines = [
             # These first ones are to enable secure functions
-            f.write(f"SEARCH_TOKEN={secrets.token_urlsafe(16)}\n")
-            f.write(f"CRITIC_TOKEN={secrets.token_urlsafe(16)}\n")
-            f.write(f"REVISOR_TOKEN={secrets.token_urlsafe(16)}\n")
-
+            f"SEARCH_TOKEN={search_token}",
+            f"CRITIC_TOKEN={critic_token}",
+            f"REVISOR_TOKEN={revisor_token}",
             # Add in the API key to use tavily
-            f.write(f"TAVILY_API_KEY={tavily_api_key}\n")
-
+            f"TAVILY_API_KEY={tavily_api_key}",
             # Finally, add in the agent URLs and keys to allow them to be invoked in a function call
-            f.write(
-                f"CRITIC_AGENT_ENDPOINT={agent_deployment_dict.get("critic").agent_url}\n"
-            )
-            f.write(
-                f"CRITIC_AGENT_ACCESS_KEY={agent_deployment_dict.get("critic").agent_key}\n"
-            )
-            f.write(
-                f"REVISOR_AGENT_ENDPOINT={agent_deployment_dict.get("revisor").agent_url}\n"
-            )
-            f.write(
-                f"REVISOR_AGENT_ACCESS_KEY={agent_deployment_dict.get("revisor").agent_key}\n"
-            )
+            f"CRITIC_AGENT_ENDPOINT={critic.agent_url}",
+            f"CRITIC_AGENT_ACCESS_KEY={critic.agent_key}",
+            f"REVISOR_AGENT_ENDPOINT={revisor.agent_url}",
+            f"REVISOR_AGENT_ACCESS_KEY={revisor.agent_key}",
+        ]
+        # Create an .env to create access tokens for the tools and include secrets, in a single write
+        # The file is readable only by the current user since it holds secrets
+        fd = os.open(f"{tools_path}/.env", os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        try:
+            os.write(fd, ("\n".join(lines) + "\n").encode())
+        finally:
+            os.close(fd)
 
     def deploy_functions(
         self,
@@ -413,7 +433,6 @@ class FunctionDeployer:
             logging.error(f"Error creating namespace '{namespace}': {e}")
             raise
 
-        self._login_doctl()
         temp_fn_dir = self._copy_tools_to_temp()
         self._export_secrets_to_env(temp_fn_dir, tavily_api_key, agent_deployment_dict)
         self._connect_doctl_serverless(namespace_id)
@@ -439,9 +458,26 @@ def deploy_auditor_agent_template(
     # 3. Three functions are deployed to the namespace - the search tool, and functions to invoke the critic and revisor
     # 4. The critic agent is updated to use the search tool, and the auditor agent is updated to use the critic and revisor.
 
+    import pydo
+    from agents.auditor.prompts import (
+        CRITIC_DESCRIPTION,
+        CRITIC_INPUT_SCHEMA,
+        CRITIC_OUTPUT_SCHEMA,
+        REVISOR_DESCRIPTION,
+        REVISOR_INPUT_SCHEMA,
+        REVISOR_OUTPUT_SCHEMA,
+    )
+    from agents.critic.prompts import (
+        SEARCH_DESCRIPTION,
+        SEARCH_INPUT_SCHEMA,
+        SEARCH_OUTPUT_SCHEMA,
+    )
+
     # Step 0: Init
-    agent_deployer = AgentDeployer(auth.token)
-    function_deployer = FunctionDeployer(auth.token, auth.context)
+    # Both deployers share one client, so its connections to the API are reused across steps
+    client = pydo.Client(token=auth.token)
+    agent_deployer = AgentDeployer(client)
+    function_deployer = FunctionDeployer(client, auth.token, auth.context)
 
     # Step 1: Create the agents
     logging.info("Starting Auditor agent template deployment....")
@@ -456,9 +492,6 @@ def deploy_auditor_agent_template(
         reference_kbs=reference_kbs,
     )
 
-    # Sleep for a few seconds to prevent overloading the agent API
-    time.sleep(5)
-
     # Step 2 - enable API access
     agent_deployments = agent_deployer.enable_programatic_access(agent_deployments)
 
@@ -471,7 +504,10 @@ def deploy_auditor_agent_template(
     )
 
     # Step 4 : Add tools to the agents
-    logging.info("Attaching search tool to critic agent ...")
+    # Each attachment is an independent call, so all three are made concurrently
+    logging.info(
+        "Attaching search tool to critic agent, and critic and revisor to auditor ..."
+    )
     search_config = AgentFunctionConfig(
         agent_uuid=agent_deployments["critic"].agent_uuid,
         description=SEARCH_DESCRIPTION,
@@ -481,11 +517,6 @@ def deploy_auditor_agent_template(
         input_schema=SEARCH_INPUT_SCHEMA,
         output_schema=SEARCH_OUTPUT_SCHEMA,
     )
-    agent_deployer._add_tool_to_agent(
-        agent_deployments["critic"].agent_uuid, search_config
-    )
-
-    logging.info("Adding critic to auditor")
     critic_config = AgentFunctionConfig(
         agent_uuid=agent_deployments["auditor"].agent_uuid,
         description=CRITIC_DESCRIPTION,
@@ -495,10 +526,6 @@ def deploy_auditor_agent_template(
         input_schema=CRITIC_INPUT_SCHEMA,
         output_schema=CRITIC_OUTPUT_SCHEMA,
     )
-    agent_deployer._add_tool_to_agent(
-        agent_deployments["auditor"].agent_uuid, critic_config
-    )
-    logging.info("Adding revisor to auditor")
     revisor_config = AgentFunctionConfig(
         agent_uuid=agent_deployments["auditor"].agent_uuid,
         description=REVISOR_DESCRIPTION,
@@ -508,21 +535,32 @@ def deploy_auditor_agent_template(
         input_schema=REVISOR_INPUT_SCHEMA,
         output_schema=REVISOR_OUTPUT_SCHEMA,
     )
-    agent_deployer._add_tool_to_agent(
-        agent_deployments["auditor"].agent_uuid, revisor_config
-    )
+    with concurrent.futures.ThreadPoolExecutor(max_workers=3) as executor:
+        futures = [
+            executor.submit(
+                agent_deployer._add_tool_to_agent, config.agent_uuid, config
+            )
+            for config in [search_config, critic_config, revisor_config]
+        ]
+        # Re-raise the first failure, if any
+        for future in concurrent.futures.as_completed(futures):
+            future.result()
 
     logging.info("Tools attachment completed")
 
+    auditor_uuid = agent_deployments["auditor"].agent_uuid
     logging.info(
-        f"Auditor agent deployment completed!\nYou can find your agent at : https://cloud.digitalocean.com/gen-ai/agents/{agent_deployments["auditor"].agent_uuid}\nNote:It may be a few minutes before your agent is ready to use."
+        f"Auditor agent deployment completed!\nYou can find your agent at : https://cloud.digitalocean.com/gen-ai/agents/{auditor_uuid}\nNote:It may be a few minutes before your agent is ready to use."
     )
 
 
-def get_arg_or_env(arg_value, env_var, default=None, nullable=True):
+def get_arg_or_env(arg_value, env_var, default=None, nullable=True, env=None):
+    # env is an optional snapshot of the environment, os.environ is used otherwise
     if arg_value is not None:
         return arg_value
-    val = os.getenv(env_var, default)
+    if env is None:
+        env = os.environ
+    val = env.get(env_var, default)
     if not nullable and val is None:
         raise ValueError(f"{env_var} cannot be None. Please specify it.")
     return val
@@ -543,7 +581,7 @@ def main():
     parser.add_argument("--model-uuid", help="The model ID to use")
     parser.add_argument(
         "--kbs",
-        type=lambda a: json.loads("[" + a.replace(" ", ",") + "]"),
+        nargs="+",
         default=None,
         help="List of Knowledge Base IDs (optional)",
     )
@@ -551,27 +589,40 @@ def main():
     args = parser.parse_args()
 
     if args.env_file:
+        from dotenv import load_dotenv
+
         load_dotenv(dotenv_path=args.env_file)
 
+    # The environment is read once, after any .env has been loaded
+    env = dict(os.environ)
+
     deploy_auditor_agent_template(
         auth=DOAuth(
-            get_arg_or_env(args.token, "DIGITALOCEAN_TOKEN", nullable=False),
+            get_arg_or_env(args.token, "DIGITALOCEAN_TOKEN", nullable=False, env=env),
             get_arg_or_env(
-                args.context, "DIGITALOCEAN_CONTEXT", default="default", nullable=False
+                args.context,
+                "DIGITALOCEAN_CONTEXT",
+                default="default",
+                nullable=False,
+                env=env,
             ),
         ),
-        project_id=get_arg_or_env(args.project_id, "PROJECT_ID", nullable=False),
+        project_id=get_arg_or_env(
+            args.project_id, "PROJECT_ID", nullable=False, env=env
+        ),
         tavily_api_key=get_arg_or_env(
-            args.tavily_api_key, "TAVILY_API_KEY", nullable=False
+            args.tavily_api_key, "TAVILY_API_KEY", nullable=False, env=env
         ),
         namespace_label=get_arg_or_env(
-            args.namespace_label, "NAMESPACE_LABEL", nullable=False
+            args.namespace_label, "NAMESPACE_LABEL", nullable=False, env=env
+        ),
+        region=get_arg_or_env(
+            args.region, "REGION", DEFAULT_REGION, nullable=False, env=env
         ),
-        region=get_arg_or_env(args.region, "REGION", DEFAULT_REGION, nullable=False),
         model_uuid=get_arg_or_env(
-            args.model_uuid, "MODEL_UUID", LLAMA_3_3_70B_UUID, nullable=False
+            args.model_uuid, "MODEL_UUID", LLAMA_3_3_70B_UUID, nullable=False, env=env
         ),
-        reference_kbs=get_arg_or_env(args.kbs, "KNOWLEDGE_BASE_IDS"),
+        reference_kbs=get_arg_or_env(args.kbs, "KNOWLEDGE_BASE_IDS", env=env),
     )
 
 
@@ -1,4 +1,9 @@
-import requests
+import asyncio
+import collections
+import hashlib
+import logging
+import time
+import httpx
 from typing import Dict, Any
 import os
 
@@ -8,8 +13,35 @@ AGENT_ACCESS_KEY = os.getenv("CRITIC_AGENT_ACCESS_KEY")
 
 API_URL = f"{AGENT_ENDPOINT}/api/v1/chat/completions"
 
+NO_RESPONSE = "The agent did not respond"
 
-def get_response(query: str) -> str:
+# Responses with these statuses are retried with exponential backoff
+RETRY_STATUSES = {429, 502, 503, 504}
+MAX_RETRIES = 3
+BACKOFF_FACTOR = 0.3
+
+# Assessments are cached per container, since the same question and answer pair is often
+# re-checked while the auditor revises. Entries expire after CACHE_TTL seconds
+CACHE_SIZE = 512
+CACHE_TTL = int(os.getenv("CRITIC_CACHE_TTL", "3600"))
+_RESPONSE_CACHE = collections.OrderedDict()
+
+# The client is created once per container, so warm invocations reuse its HTTP/2 connection.
+# An httpx client is bound to the event loop it connects on, so the loop is kept alive too
+# instead of creating a new one with asyncio.run on every call
+LOOP = asyncio.new_event_loop()
+# Pool and HTTP/2 settings live on the transport, since the client ignores its own when one is given
+CLIENT = httpx.AsyncClient(
+    timeout=httpx.Timeout(60.0),
+    transport=httpx.AsyncHTTPTransport(
+        http2=True,
+        limits=httpx.Limits(max_connections=50, max_keepalive_connections=10),
+        retries=MAX_RETRIES,
+    ),
+)
+
+
+async def get_response(query: str) -> str:
     headers = {
         "Content-Type": "application/json",
         "Authorization": f"Bearer {AGENT_ACCESS_KEY}",
@@ -22,19 +54,46 @@ def get_response(query: str) -> str:
         "include_guardrails_info": False,
     }
 
-    response = requests.post(API_URL, headers=headers, json=payload)
+    for attempt in range(MAX_RETRIES + 1):
+        response = await CLIENT.post(API_URL, headers=headers, json=payload)
+        if response.status_code not in RETRY_STATUSES or attempt == MAX_RETRIES:
+            break
+        await asyncio.sleep(BACKOFF_FACTOR * (2**attempt))
     response.raise_for_status()
 
     choices = response.json().get("choices", [])
     if choices:
         response_string = choices[0].get("message", {}).get("content", "")
     else:
-        response_string = "The agent did not respond"
+        response_string = NO_RESPONSE
+
+    return response_string
+
+
+def _cache_key(query: str) -> str:
+    return hashlib.blake2b(query.encode("utf-8"), digest_size=16).hexdigest()
+
+
+async def get_cached_response(query: str) -> str:
+    key = _cache_key(query)
+    entry = _RESPONSE_CACHE.get(key)
+    if entry is not None and time.monotonic() - entry[0] < CACHE_TTL:
+        _RESPONSE_CACHE.move_to_end(key)
+        logging.info(f"Critic cache hit: {key}")
+        return entry[1]
 
+    logging.info(f"Critic cache miss: {key}")
+    response_string = await get_response(query)
+    if response_string == NO_RESPONSE:
+        return response_string
+    _RESPONSE_CACHE[key] = (time.monotonic(), response_string)
+    _RESPONSE_CACHE.move_to_end(key)
+    if len(_RESPONSE_CACHE) > CACHE_SIZE:
+        _RESPONSE_CACHE.popitem(last=False)
     return response_string
 
 
 def main(args: Dict[str, Any]):
     query = args.get("query")
-    agent_response = get_response(query)
+    agent_response = LOOP.run_until_complete(get_cached_response(query))
     return {"body": {"assessment": agent_response}}
@@ -1,4 +1,6 @@
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from typing import Dict, Any
 import os
 
@@ -8,6 +10,23 @@ AGENT_ACCESS_KEY = os.getenv("REVISOR_AGENT_ACCESS_KEY")
 
 API_URL = f"{AGENT_ENDPOINT}/api/v1/chat/completions"
 
+# The session is created once per container, so warm invocations reuse the pooled connection
+# instead of opening a new TLS connection on every call. Transient errors are retried with backoff
+SESSION = requests.Session()
+SESSION.mount(
+    "https://",
+    HTTPAdapter(
+        pool_connections=10,
+        pool_maxsize=50,
+        max_retries=Retry(
+            total=3,
+            backoff_factor=0.3,
+            status_forcelist=[429, 502, 503, 504],
+            allowed_methods=frozenset({"POST"}),
+        ),
+    ),
+)
+
 
 def get_response(query: str) -> str:
     headers = {
@@ -22,7 +41,7 @@ def get_response(query: str) -> str:
         "include_guardrails_info": False,
     }
 
-    response = requests.post(API_URL, headers=headers, json=payload)
+    response = SESSION.post(API_URL, headers=headers, json=payload)
     response.raise_for_status()
 
     choices = response.json().get("choices", [])
@@ -1,7 +1,13 @@
 # This function is used by the critic agent to search the web to verify factual information.
 
 import os
+import io
+import collections
+import logging
+import time
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from typing import Any, Dict
 
 TAVILY_API_KEY = os.getenv("TAVILY_API_KEY")
@@ -11,6 +17,32 @@ API_URL = "https://api.tavily.com/search"
 # This is to prevent the search context from being very large and crossing the input token limit of the agent in rare circumstances
 # As a rough estimatem, 1 token ~= 4 English characters, so this restricts the search results to roughly 3K tokens.
 CHARACTER_LIMIT = 12000
+# Fewer, shallower results keep the response small, since most of it would be cut by the limit anyway
+MAX_RESULTS = 5
+SEARCH_DEPTH = "basic"
+
+# Search results are cached per container, since the critic often repeats a query while
+# the auditor revises. Entries expire after SEARCH_CACHE_TTL seconds
+CACHE_SIZE = 1024
+CACHE_TTL = int(os.getenv("SEARCH_CACHE_TTL", "3600"))
+_SEARCH_CACHE = collections.OrderedDict()
+
+# The session is created once per container, so warm invocations reuse the pooled connection
+# instead of opening a new TLS connection on every call. Transient errors are retried with backoff
+SESSION = requests.Session()
+SESSION.mount(
+    "https://",
+    HTTPAdapter(
+        pool_connections=10,
+        pool_maxsize=50,
+        max_retries=Retry(
+            total=3,
+            backoff_factor=0.3,
+            status_forcelist=[429, 502, 503, 504],
+            allowed_methods=frozenset({"POST"}),
+        ),
+    ),
+)
 
 
 def search(query: str) -> str:
@@ -18,23 +50,41 @@ def search(query: str) -> str:
         "Content-Type": "application/json",
         "Authorization": f"Bearer {TAVILY_API_KEY}",
     }
-    data = {"query": query}
+    data = {"query": query, "max_results": MAX_RESULTS, "search_depth": SEARCH_DEPTH}
 
-    response = requests.post(API_URL, headers=headers, json=data)
+    response = SESSION.post(API_URL, headers=headers, json=data)
     response.raise_for_status()
     response_dict = response.json()
     sources = response_dict.get("results", [])
-    context = [
-        {"url": source["url"], "content": source["content"]} for source in sources
-    ]
-    # Combine into one string
-    context_string = "\n\n".join(
-        f"Url: {item['url']}\nContext: {item['content']}" for item in context
-    )
-    return context_string[: min(len(context_string), CHARACTER_LIMIT)]
+    # Combine into one string, stopping once the limit is reached
+    context = io.StringIO()
+    for source in sources:
+        if context.tell():
+            context.write("\n\n")
+        context.write(f"Url: {source['url']}\nContext: {source['content']}")
+        if context.tell() >= CHARACTER_LIMIT:
+            break
+    return context.getvalue()[:CHARACTER_LIMIT]
+
+
+def cached_search(query: str) -> str:
+    key = query.strip().lower()
+    entry = _SEARCH_CACHE.get(key)
+    if entry is not None and time.monotonic() - entry[0] < CACHE_TTL:
+        _SEARCH_CACHE.move_to_end(key)
+        logging.info(f"Search cache hit: {key}")
+        return entry[1]
+
+    logging.info(f"Search cache miss: {key}")
+    search_context = search(query)
+    _SEARCH_CACHE[key] = (time.monotonic(), search_context)
+    _SEARCH_CACHE.move_to_end(key)
+    if len(_SEARCH_CACHE) > CACHE_SIZE:
+        _SEARCH_CACHE.popitem(last=False)
+    return search_context
 
 
 def main(args: Dict[str, Any]):
     query = args.get("query")
-    search_context = search(query)
+    search_context = cached_search(query)
     return {"body": {"context": search_context}}
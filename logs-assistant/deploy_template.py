@@ -1,7 +1,10 @@
 import pydo
 import os
+import asyncio
+import collections
+import contextlib
+import concurrent.futures
 from typing import Optional
-import subprocess
 from agent.prompts import (
     SYSTEM_PROMPT,
     GET_LOGS_INPUT_SCHEMA,
@@ -26,7 +29,7 @@ logging.basicConfig(
 )
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class AgentConfig:
     agent_name: str
     agent_description: str
@@ -46,7 +49,7 @@ class AgentConfig:
         }
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class AgentFunctionConfig:
     agent_uuid: str
     description: str
@@ -68,7 +71,7 @@ class AgentFunctionConfig:
         }
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class DOAuth:
     token: str
     context: str
@@ -102,6 +105,9 @@ class AgentDeployer:
         deployment = self._deploy_agent(config)
         return deployment
 
+    def delete_agent(self, agent_uuid: str):
+        self.client.agents.delete(agent_uuid)
+
     def _add_tool_to_agent(self, agent_uuid: str, function_config: AgentFunctionConfig):
         # Add tools to the agent
         try:
@@ -147,14 +153,51 @@ class FunctionDeployer:
             fn_namespace = self.client.functions.create_namespace(
                 body={"" "label": namespace, "region": region}
             )
-            logging.info("Waiting for namespace creation.")
-            time.sleep(10)
             return fn_namespace
         except Exception as e:
             logging.error(f"Error creating namespace '{namespace}': {e}")
             raise
 
-    def _login_doctl(self):
+    async def wait_for_namespace_ready(
+        self, namespace_id: str, timeout: float = 60, max_interval: float = 2
+    ):
+        # Poll until the namespace can be fetched with its API host, rather than sleeping for a fixed time
+        # The interval starts at 100ms and doubles up to max_interval, so a quick namespace is picked up quickly
+        logging.info("Waiting for namespace creation.")
+        deadline = time.monotonic() + timeout
+        interval = 0.1
+        while time.monotonic() < deadline:
+            try:
+                response = await asyncio.to_thread(
+                    self.client.functions.get_namespace, namespace_id
+                )
+                if response.get("namespace", {}).get("api_host"):
+                    return
+            except Exception as e:
+                logging.info(f"Namespace {namespace_id} is not ready yet: {e}")
+            await asyncio.sleep(interval)
+            interval = min(interval * 2, max_interval)
+        raise Exception(
+            f"Namespace {namespace_id} was not ready within {timeout} seconds."
+        )
+
+    async def _run_doctl(self, command: list):
+        # Runs a doctl command without blocking the event loop, logging its output as it arrives
+        # Returns the return code and the last lines of output, which are used in error messages
+        process = await asyncio.create_subprocess_exec(
+            *command,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT,
+        )
+        tail = collections.deque(maxlen=200)
+        async for raw_line in process.stdout:
+            line = raw_line.decode(errors="replace").rstrip()
+            logging.info(f"Doctl output: {line}")
+            tail.append(line)
+        returncode = await process.wait()
+        return returncode, "\n".join(tail)
+
+    async def _login_doctl(self):
         command = [
             "doctl",
             "auth",
@@ -166,18 +209,14 @@ class FunctionDeployer:
             "--interactive",
             "false",
         ]
-        try:
-            result = subprocess.run(command, capture_output=True, text=True, check=True)
-            if result.returncode == 0:
-                logging.info("doctl login successful")
-            else:
-                logging.error(f"Error logging in to doctl: {result.stderr}")
-                raise Exception(f"doctl login failed: {result.stderr}")
-        except subprocess.CalledProcessError as e:
-            logging.error(f"doctl login failed: {e.stderr}")
-            raise Exception(f"doctl login failed: {e.stderr}")
-
-    def _connect_doctl_serverless(self, namespace: str):
+        returncode, output = await self._run_doctl(command)
+        if returncode == 0:
+            logging.info("doctl login successful")
+        else:
+            logging.error(f"doctl login failed: {output}")
+            raise Exception(f"doctl login failed: {output}")
+
+    async def _connect_doctl_serverless(self, namespace: str):
         command = [
             "doctl",
             "serverless",
@@ -186,51 +225,70 @@ class FunctionDeployer:
             "-t",
             self.token,
         ]
-        try:
-            result = subprocess.run(command, capture_output=True, text=True, check=True)
-            logging.info(f"Doctl output:{result.stdout}")
-            if result.returncode == 0:
-                logging.info("doctl serverless connection successful")
-            else:
-                logging.error(f"Error connecting to serverless doctl: {result.stderr}")
-                raise Exception(f"doctl serverless connect failed: {result.stderr}")
-        except subprocess.CalledProcessError as e:
-            logging.error(f"doctl serverless connection failed: {e.stderr}")
-            raise Exception(f"doctl serverless connect failed: {e.stderr}")
-
-    def _deploy_doctl_serverless(self, fn_dir: str):
+        returncode, output = await self._run_doctl(command)
+        if returncode == 0:
+            logging.info("doctl serverless connection successful")
+        else:
+            logging.error(f"doctl serverless connection failed: {output}")
+            raise Exception(f"doctl serverless connect failed: {output}")
+
+    async def _deploy_doctl_serverless(self, fn_dir: str):
         command = [
             "doctl",
             "serverless",
             "deploy",
             fn_dir,
         ]
-        try:
-            result = subprocess.run(command, capture_output=True, text=True, check=True)
-            logging.info(f"Doctl output:{result.stdout}")
-            if result.returncode == 0:
-                logging.info("doctl deploy successful")
-            else:
-                logging.error(f"Error deploying to doctl serverless: {result.stderr}")
-                raise Exception(f"doctl serverless deploy failed: {result.stderr}")
-        except subprocess.CalledProcessError as e:
-            logging.error(f"doctl serverless failed: {e.stderr}")
-            raise Exception(f"doctl serverless deploy failed: {e.stderr}")
+        returncode, output = await self._run_doctl(command)
+        if returncode == 0:
+            logging.info("doctl deploy successful")
+        else:
+            logging.error(f"doctl serverless failed: {output}")
+            raise Exception(f"doctl serverless deploy failed: {output}")
 
     def _copy_tools_to_temp(self) -> str:
         temp_dir = tempfile.mkdtemp()
         dest = os.path.join(temp_dir, "tools")
-        shutil.copytree("./tools", dest)
+        # Files written during the deploy are skipped, so a fresh .env or a build's virtualenv
+        # never writes through a hardlink into the source tree
+        ignore = shutil.ignore_patterns(
+            ".env", "virtualenv", ".deployed", "__pycache__"
+        )
+        try:
+            # Hardlinks avoid copying file contents when the temp dir is on the same filesystem
+            shutil.copytree("./tools", dest, copy_function=os.link, ignore=ignore)
+        except (shutil.Error, OSError) as e:
+            # Hardlinks can't cross filesystems (EXDEV), so fall back to a regular copy
+            logging.info(f"Could not hardlink tools ({e}). Copying instead...")
+            shutil.rmtree(dest, ignore_errors=True)
+            shutil.copytree("./tools", dest, ignore=ignore)
         return dest
 
     def _export_secrets_to_env(self, tools_path: str, agent_token: str):
-        # Create an intial .env to create access tokens for the tools
+        # Create an intial .env to create access tokens for the tools, in a single write
+        content = (
+            f"GET_LOGS_TOKEN={secrets.token_urlsafe(16)}\nAGENT_TOKEN={agent_token}\n"
+        )
         with open(f"{tools_path}/.env", "w") as f:
-            f.write(f"GET_LOGS_TOKEN={secrets.token_urlsafe(16)}\n")
-            f.write(f"AGENT_TOKEN={agent_token}\n")
+            f.write(content)
 
-    def deploy_functions(self, namespace: str, region: str, agent_token: str):
-        fn_namespace = self.create_namespace(namespace, region)
+    @contextlib.contextmanager
+    def _staged_tools(self, agent_token: str):
+        # Yields a deployable copy of the tools with its .env, and removes it afterwards
+        # so the generated secrets don't outlive the deploy
+        fn_dir = self._copy_tools_to_temp()
+        try:
+            self._export_secrets_to_env(fn_dir, agent_token)
+            yield fn_dir
+        finally:
+            shutil.rmtree(os.path.dirname(fn_dir), ignore_errors=True)
+
+    async def _deploy_functions(self, namespace: str, region: str, agent_token: str):
+        # doctl login doesn't depend on the namespace, so it runs while the namespace is created
+        fn_namespace, _ = await asyncio.gather(
+            asyncio.to_thread(self.create_namespace, namespace, region),
+            self._login_doctl(),
+        )
         try:
             namespace_id = fn_namespace.get("namespace", {}).get("namespace")
             if not namespace_id:
@@ -241,13 +299,32 @@ class FunctionDeployer:
             logging.error(f"Error creating namespace '{namespace}': {e}")
             raise
 
-        self._login_doctl()
-        temp_fn_dir = self._copy_tools_to_temp()
-        self._export_secrets_to_env(temp_fn_dir, agent_token)
-        self._connect_doctl_serverless(namespace_id)
-        self._deploy_doctl_serverless(temp_fn_dir)
+        with self._staged_tools(agent_token) as fn_dir:
+            await self.wait_for_namespace_ready(namespace_id)
+            await self._connect_doctl_serverless(namespace_id)
+            await self._deploy_doctl_serverless(fn_dir)
         return namespace_id
 
+    def deploy_functions(self, namespace: str, region: str, agent_token: str):
+        return asyncio.run(self._deploy_functions(namespace, region, agent_token))
+
+
+# The agent is created while the functions deploy, so if they fail it would be left behind without tools
+def _discard_agent(agent_deployer: AgentDeployer, agent_future):
+    try:
+        agent = agent_future.result()
+    except Exception:
+        # The agent wasn't created either
+        return
+    agent_uuid = agent.agent.uuid
+    logging.info(
+        f"Deleting agent {agent_uuid}, since the functions failed to deploy..."
+    )
+    try:
+        agent_deployer.delete_agent(agent_uuid)
+    except Exception as e:
+        logging.error(f"Could not delete agent {agent_uuid}. Delete it manually: {e}")
+
 
 def deploy_logs_agent_template(
     auth: DOAuth,
@@ -260,23 +337,31 @@ def deploy_logs_agent_template(
 ):
     logging.info("Starting Logs Assistant Agent template deployment...")
 
-    # Step 1: Deploy the functions
-    logging.info("Deploying functions...")
     function_deployer = FunctionDeployer(token=auth.token, context=auth.context)
-    namespace_id = function_deployer.deploy_functions(
-        namespace=namespace_label, region=region, agent_token=agent_token
-    )
-    logging.info(f"Functions deployed in namespace: {namespace_id}")
-
-    # Step 2: Create the agent
-    logging.info("Creating agent...")
     agent_deployer = AgentDeployer(token=auth.token)
-    agent = agent_deployer.create_template_agent(
-        project_id=project_id,
-        region=region,
-        agent_name=agent_name,
-        model_uuid=model_uuid,
-    )
+
+    # Steps 1 and 2: Deploy the functions and create the agent
+    # The API has no call that creates an agent together with its functions, but the agent
+    # doesn't depend on the functions, so it is created while they deploy
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+        logging.info("Creating agent...")
+        agent_future = executor.submit(
+            agent_deployer.create_template_agent,
+            project_id=project_id,
+            region=region,
+            agent_name=agent_name,
+            model_uuid=model_uuid,
+        )
+        logging.info("Deploying functions...")
+        try:
+            namespace_id = function_deployer.deploy_functions(
+                namespace=namespace_label, region=region, agent_token=agent_token
+            )
+        except Exception:
+            _discard_agent(agent_deployer, agent_future)
+            raise
+        logging.info(f"Functions deployed in namespace: {namespace_id}")
+        agent = agent_future.result()
     logging.info(f"Agent created: {agent}")
 
     # Step 3: Attach the tools to the agent
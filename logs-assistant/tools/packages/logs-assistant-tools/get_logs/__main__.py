@@ -1,9 +1,37 @@
 import os
-import requests
+import asyncio
+import httpx
 import re
+from collections import deque
+from typing import Optional
 from datetime import datetime, timezone
 
 MAX_BLOCK_COUNT = 10
+BLOCK_SEPARATOR = "-" * 40
+
+# The client is created once per container, so warm invocations reuse its HTTP/2 connections
+# to the API and to the log storage. Concurrent requests to the same host share one connection.
+# An httpx client is bound to the event loop it connects on, so the loop is kept alive too
+_LOOP = asyncio.new_event_loop()
+_CLIENT = httpx.AsyncClient(
+    timeout=httpx.Timeout(30.0),
+    transport=httpx.AsyncHTTPTransport(
+        http2=True, limits=httpx.Limits(max_connections=8, max_keepalive_connections=4)
+    ),
+)
+
+# The token is fixed for the life of the container, so the headers are built once
+_HEADERS = {
+    "Content-Type": "application/json",
+    "Authorization": f"Bearer {os.getenv('AGENT_TOKEN')}",
+}
+
+# Pattern to detect the start of a log entry by log level
+# Compiled once per container, so warm invocations reuse it. It is run over whole chunks of the body,
+# so ^ matches at every line start and [^\S\n] keeps a match from spanning lines
+_ENTRY_START_RE = re.compile(
+    r"(?m)^\S+[^\S\n]+\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}\.\d+Z[^\S\n]+(INFO|ERROR|WARNING):"
+)
 
 
 def get_current_timestamp():
@@ -12,7 +40,7 @@ def get_current_timestamp():
     return f"The current time is: {utc_now.isoformat()}\n---\n"
 
 
-def get_digitalocean_app_logs(app_id: str, log_type: str):
+async def get_digitalocean_app_logs(app_id: str, log_type: str):
     """
     Fetch logs for a DigitalOcean app with a specific log type.
 
@@ -22,11 +50,9 @@ def get_digitalocean_app_logs(app_id: str, log_type: str):
     :return: JSON response containing logs.
     """
     url = f"https://api.digitalocean.com/v2/apps/{app_id}/logs"
-    token = os.getenv("AGENT_TOKEN")
-    headers = {"Content-Type": "application/json", "Authorization": f"Bearer {token}"}
     params = {"type": log_type}
 
-    response = requests.get(url, headers=headers, params=params)
+    response = await _CLIENT.get(url, headers=_HEADERS, params=params)
 
     if response.status_code == 200:
         return response.json()
@@ -36,35 +62,116 @@ def get_digitalocean_app_logs(app_id: str, log_type: str):
         raise Exception(f"Error {response.status_code}: {response.text}")
 
 
-def create_log_set(application_id):
+async def create_log_set(application_id):
     log_set = get_current_timestamp()
-    log_set += "\nBuildtime Errors:\n" + get_error_logs_for_application(
-        application_id, "BUILD"
-    )
-    log_set += "\nDeploytime Errors:\n" + get_error_logs_for_application(
-        application_id, "DEPLOY"
-    )
-    log_set += "\nRuntime Errors:\n" + get_error_logs_for_application(
-        application_id, "RUN"
+    # The three log types are independent, so they are fetched concurrently
+    build_logs, deploy_logs, run_logs = await asyncio.gather(
+        *(
+            get_error_logs_for_application(application_id, log_type)
+            for log_type in ("BUILD", "DEPLOY", "RUN")
+        )
     )
+    log_set += "\nBuildtime Errors:\n" + build_logs
+    log_set += "\nDeploytime Errors:\n" + deploy_logs
+    log_set += "\nRuntime Errors:\n" + run_logs
     return log_set
 
 
 def get_runtime_error_logs(application_id: str):
-    return get_error_logs_for_application(application_id, "RUN")
+    return _LOOP.run_until_complete(
+        get_error_logs_for_application(application_id, "RUN")
+    )
 
 
 def get_buildtime_error_logs(application_id: str):
-    return get_error_logs_for_application(application_id, "BUILD")
+    return _LOOP.run_until_complete(
+        get_error_logs_for_application(application_id, "BUILD")
+    )
 
 
 def get_deploytime_error_logs(application_id: str):
-    return get_error_logs_for_application(application_id, "DEPLOY")
+    return _LOOP.run_until_complete(
+        get_error_logs_for_application(application_id, "DEPLOY")
+    )
 
 
-def get_error_logs_for_application(application_id: str, log_type: str):
+def _find_or_end(text: str, keyword: str, pos: int, end: int) -> int:
+    index = text.find(keyword, pos, end)
+    return end if index == -1 else index
+
+
+def _scan_blocks(text: str, pos: int, end: int, block_start: Optional[int], blocks):
+    # Scans the complete lines of text[pos:end], and returns where the open block starts, if there is one.
+    # Outside a block the scan jumps straight to the next ERROR or WARNING, and inside one to the next
+    # entry start, which are the only lines the line-by-line loop acted on.
+    # str.find is used for the keywords since it is several times faster than an ERROR|WARNING regex,
+    # and each keyword's next position is kept until the scan passes it
+    next_error = next_warning = -1
+    while pos < end:
+        if block_start is not None:
+            match = _ENTRY_START_RE.search(text, pos, end)
+            if match is None:
+                break
+            # Any new entry ends the block, and the check below opens a new one if it is an error too
+            blocks.append(text[block_start : match.start() - 1])
+            block_start = None
+            pos = match.start()
+        if next_error < pos:
+            next_error = _find_or_end(text, "ERROR", pos, end)
+        if next_warning < pos:
+            next_warning = _find_or_end(text, "WARNING", pos, end)
+        hit = min(next_error, next_warning)
+        if hit == end:
+            break
+        line_start = text.rfind("\n", pos, hit) + 1 or pos
+        if _ENTRY_START_RE.match(text, line_start, end):
+            block_start = line_start
+        pos = text.find("\n", hit, end) + 1
+    return block_start
+
+
+async def _collect_blocks(chunks):
+    # The body is scanned a chunk at a time with str.find and the entry start pattern instead of being split into lines.
+    # Only the last MAX_BLOCK_COUNT blocks, the open block and the last partial line are held in memory
+    blocks = deque(maxlen=MAX_BLOCK_COUNT)
+    pending = ""
+    pos = 0
+    block_start = None
+    carry = ""
+
+    async for chunk in chunks:
+        chunk = carry + chunk
+        # \r\n and a bare \r (progress output in build logs) both end a line. A trailing \r is held
+        # back until the next chunk shows whether it is the start of a \r\n
+        carry = "\r" if chunk.endswith("\r") else ""
+        if carry:
+            chunk = chunk[:-1]
+        pending += chunk.replace("\r\n", "\n").replace("\r", "\n")
+        # Only complete lines are scanned, the partial last line waits for the next chunk
+        end = pending.rfind("\n") + 1
+        if end <= pos:
+            continue
+        block_start = _scan_blocks(pending, pos, end, block_start, blocks)
+        if block_start is None:
+            pending, pos = pending[end:], 0
+        else:
+            pending, pos, block_start = pending[block_start:], end - block_start, 0
+
+    # A trailing \r ends the last line just like \n
+    if carry or (pending and not pending.endswith("\n")):
+        pending += "\n"
+    block_start = _scan_blocks(pending, pos, len(pending), block_start, blocks)
+    # Add last block if any
+    if block_start is not None:
+        blocks.append(pending[block_start:-1])
+    return blocks
+
+
+async def get_error_logs_for_application(application_id: str, log_type: str):
     try:
-        logs_resp = get_digitalocean_app_logs(app_id=application_id, log_type=log_type)
+        logs_resp = await get_digitalocean_app_logs(
+            app_id=application_id, log_type=log_type
+        )
         url = logs_resp.get("url")
         if url is None:
             historic_urls = logs_resp.get("historic_urls")
@@ -74,48 +181,14 @@ def get_error_logs_for_application(application_id: str, log_type: str):
                     return message
                 return "No logs URL or historic log URL could be obtained. No logs were found."
             url = historic_urls[0]
-        response = requests.get(url)
-        response.raise_for_status()
-        lines = response.text.splitlines()
+        # The body is streamed and parsed chunk by chunk as it arrives, instead of decoding it all up front
+        async with _CLIENT.stream("GET", url) as response:
+            response.raise_for_status()
+            blocks = await _collect_blocks(response.aiter_text(chunk_size=65536))
 
-        # Pattern to detect the start of a log entry by log level
-        entry_start_pattern = re.compile(
-            r"^\S+\s+\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}\.\d+Z\s+(INFO|ERROR|WARNING):"
+        error_string = "\n".join(
+            f"{BLOCK_SEPARATOR}\n{block}\n{BLOCK_SEPARATOR}" for block in blocks
         )
-
-        blocks = []
-        current_block = []
-        capturing = False
-
-        for line in lines:
-            is_entry_start = bool(entry_start_pattern.match(line))
-            is_error_or_warning = "ERROR" in line or "WARNING" in line
-
-            if is_error_or_warning and is_entry_start:
-                # Start a new block
-                if current_block:
-                    blocks.append("\n".join(current_block))
-                    current_block = []
-                capturing = True
-
-            if capturing:
-                if is_entry_start and not is_error_or_warning and current_block:
-                    # A new entry that's NOT error/warning means end of this block
-                    blocks.append("\n".join(current_block))
-                    current_block = []
-                    capturing = False
-
-            if capturing:
-                current_block.append(line)
-
-        # Add last block if any
-        if current_block:
-            blocks.append("\n".join(current_block))
-        # Get last set of blocks
-        blocks = blocks[-MAX_BLOCK_COUNT:]
-        error_string = ""
-        for block in blocks:
-            error_string += "-" * 40 + "\n" + block + "\n" + "-" * 40
         if not len(error_string):
             error_string = "No errors or warnings were found!"
         return error_string
@@ -132,4 +205,4 @@ def main(args):
     app_id = args.get("app_id")
     if app_id is None:
         return {"body": create_response("Please provide a valid App ID")}
-    return {"body": create_response(create_log_set(app_id))}
+    return {"body": create_response(_LOOP.run_until_complete(create_log_set(app_id)))}
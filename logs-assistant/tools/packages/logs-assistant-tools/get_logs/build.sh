@@ -0,0 +1,7 @@
+#!/bin/bash
+
+set -e
+
+# httpx isn't part of the functions runtime, so it is installed next to the function
+virtualenv --without-pip virtualenv
+pip install -r requirements.txt --target virtualenv/lib/python3.11/site-packages
@@ -1,24 +1,199 @@
-import pydo
 import os
 import logging
 import argparse
-import boto3
 import time
+import asyncio
+import math
+import random
+import concurrent.futures
+import functools
+import hashlib
+import json
+import posixpath
 from typing import Optional
 from agent.prompts import (
     SYSTEM_PROMPT_TEMPLATE,
 )
 from agent.constants import LLAMA_3_3_70B_UUID, EMBEDDING_MODEL_UUID, AGENT_NAME
 from dataclasses import dataclass
-from dotenv import load_dotenv
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s"
-)
+# Logging is configured in main, so importing this module doesn't change the caller's logging setup
+logger = logging.getLogger(__name__)
 
 import os
 
+MULTIPART_THRESHOLD = 8 * 1024 * 1024
+MULTIPART_CHUNKSIZE = 8 * 1024 * 1024
+MAX_ATTEMPTS = 6
+CHECKPOINT_DIR = os.path.join(os.path.expanduser("~"), ".gradient", "checkpoints")
+
+
+# Files above the threshold are uploaded as concurrent multipart chunks. Smaller files are sent with a single PUT
+def _transfer_config(size: int):
+    from boto3.s3.transfer import TransferConfig
+
+    return TransferConfig(
+        multipart_threshold=MULTIPART_THRESHOLD,
+        multipart_chunksize=_part_size(size),
+        max_concurrency=10,
+        use_threads=True,
+    )
+
+
+def _part_size(size: int):
+    # Very large files use bigger parts, so they aren't split into thousands of small requests
+    return max(int(math.sqrt(5 * 1024 * 1024 * size)), MULTIPART_CHUNKSIZE)
+
+
+def _md5_of(f, length: int):
+    md5 = hashlib.md5()
+    while length > 0:
+        chunk = f.read(min(length, 1024 * 1024))
+        if not chunk:
+            break
+        md5.update(chunk)
+        length -= len(chunk)
+    return md5
+
+
+# Returns the ETag Spaces reports for the file once uploaded. Small files are sent with a single PUT,
+# so theirs is the MD5 of the content. A multipart ETag is the MD5 of the concatenated part MD5s
+# followed by "-<part count>", and the part size only depends on the file size
+def _file_etag(path: str, size: int) -> str:
+    with open(path, "rb") as f:
+        if size < MULTIPART_THRESHOLD:
+            return _md5_of(f, size).hexdigest()
+        part_size = _part_size(size)
+        digests = [
+            _md5_of(f, min(part_size, size - start)).digest()
+            for start in range(0, size, part_size)
+        ]
+    return f"{hashlib.md5(b''.join(digests)).hexdigest()}-{len(digests)}"
+
+
+def _wait_until(
+    predicate, max_wait: float = 60, base: float = 0.5, factor: float = 2.0
+):
+    # Polls predicate with capped exponential backoff and jitter until it returns True
+    # Returns False if it still isn't true after max_wait seconds
+    deadline = time.monotonic() + max_wait
+    delay = base
+    while True:
+        if predicate():
+            return True
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        time.sleep(min(random.uniform(delay / 2, delay), remaining))
+        delay = min(delay * factor, 10.0)
+
+
+def _throttle_delay(e: Exception, attempt: int) -> Optional[float]:
+    # Returns how long to wait before resending a request rejected with 429, or None for any other error
+    # pydo raises azure-core's HttpResponseError, which carries the status code and the response
+    if getattr(e, "status_code", None) != 429:
+        return None
+    response = getattr(e, "response", None)
+    headers = {k.lower(): v for k, v in getattr(response, "headers", {}).items()}
+    try:
+        if "retry-after" in headers:
+            return min(float(headers["retry-after"]), 60.0)
+        # The DigitalOcean API reports when the rate limit window resets as a unix timestamp
+        if "ratelimit-reset" in headers:
+            return min(max(float(headers["ratelimit-reset"]) - time.time(), 0.0), 60.0)
+    except ValueError:
+        pass
+    delay = min(0.5 * 2**attempt, 30.0)
+    return delay + random.uniform(0, delay)
+
+
+def _retry_on_throttle(func):
+    # pydo retries most transient errors itself, but not a POST rejected with 429 and no Retry-After header
+    # A 429 means the request was not applied, so it is safe to resend, even for create calls
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        for attempt in range(MAX_ATTEMPTS):
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                delay = _throttle_delay(e, attempt)
+                if delay is None or attempt == MAX_ATTEMPTS - 1:
+                    raise
+                logger.warning(
+                    f"{func.__name__} was rate limited. Retrying in {delay:.1f} seconds..."
+                )
+                time.sleep(delay)
+
+    return wrapper
+
+
+def _walk_files(root: str, relative: str = ""):
+    # Yields (path, posix relative path) for every file under root
+    # DirEntry caches its type, so this avoids the extra stat and relpath work done by os.walk
+    with os.scandir(root) as entries:
+        for entry in entries:
+            entry_relative = f"{relative}/{entry.name}" if relative else entry.name
+            if entry.is_dir(follow_symlinks=False):
+                yield from _walk_files(entry.path, entry_relative)
+            elif entry.is_file():
+                yield entry.path, entry_relative
+
+
+# pydo is slow to import, so it is only loaded once a client is actually needed
+# Both deployers share the client, so they reuse the same connection pool
+@functools.lru_cache(maxsize=8)
+def _pydo_client(token: str):
+    import pydo
+
+    return pydo.Client(token=token)
+
+
+# boto3 is slow to import and a session loads its service models on first use, so one session is shared
+@functools.lru_cache(maxsize=1)
+def _boto_session():
+    import boto3
+
+    return boto3.session.Session()
+
+
+def _write_json(path: str, data):
+    # Written to a temporary file first, so a concurrent or interrupted run never leaves a partial file
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+# Records the deployment steps that finished, keyed by bucket name
+# If a deployment fails, running it again resumes after the last finished step instead of
+# uploading everything again and creating a duplicate KB and agent
+class DeployCheckpoint:
+    def __init__(self, bucket_name: str):
+        self.path = os.path.join(CHECKPOINT_DIR, f"{bucket_name}.json")
+        try:
+            with open(self.path) as f:
+                self.state = json.load(f)
+        except (OSError, ValueError):
+            self.state = {}
+        if self.state:
+            logger.info(
+                f"Resuming deployment from {self.path}. Finished steps: {', '.join(self.state)}"
+            )
+
+    def get(self, step: str):
+        return self.state.get(step)
+
+    def update(self, **steps):
+        self.state.update(steps)
+        _write_json(self.path, self.state)
+
+    def clear(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
 
 @dataclass
 class AgentConfig:
@@ -88,7 +263,7 @@ class SpacesDeployer:
         spaces_secret_access_key: Optional[str] = None,
     ):
 
-        self.client = pydo.Client(token=token)
+        self.client = _pydo_client(token)
         self.project_id = project_id
         self.generated_key = False
         self.bucket_name = bucket_name
@@ -97,7 +272,7 @@ class SpacesDeployer:
         self.secret_key = spaces_secret_access_key
 
         if self.access_key is None and self.secret_key is None:
-            logging.info(
+            logger.info(
                 "Creating access keys for new spaces bucket since no key was provided.."
             )
             self.generated_key = True
@@ -110,17 +285,28 @@ class SpacesDeployer:
                 f"Either the spaces access key or the secret key is None. Specify the key correctly, or set both to None to generate a new key"
             )
 
-        session = boto3.session.Session()
+        from botocore.config import Config
+
+        # The pool is sized so the concurrent uploads don't queue up waiting for a connection, and keepalive
+        # keeps idle sockets open between requests. Adaptive retries back off on throttling and 5xx errors
+        botocore_config = Config(
+            max_pool_connections=32,
+            retries={"max_attempts": 5, "mode": "adaptive"},
+            tcp_keepalive=True,
+        )
+        session = _boto_session()
         self.boto_client = session.client(
             "s3",
             region_name=region,
             endpoint_url=f"https://{region}.digitaloceanspaces.com",
             aws_access_key_id=self.access_key,
             aws_secret_access_key=self.secret_key,
+            config=botocore_config,
         )
 
     # This creates a full access key first in order to create a new bucket
     # Unfortunately, full access keys can't have their permissions updated, so this key gets deleted later for security
+    @_retry_on_throttle
     def _create_spaces_key(self, bucket_name):
         return self.client.spaces_key.create(
             body={
@@ -129,49 +315,148 @@ class SpacesDeployer:
             }
         )
 
-    def upload_folder_to_space(self, folder_path, prefix=""):
-        for root, dirs, files in os.walk(folder_path):
-            for file in files:
-                local_path = os.path.join(root, file)
-                relative_path = os.path.relpath(local_path, folder_path)
-                s3_key = os.path.join(prefix, relative_path).replace("\\", "/")
+    def _list_existing_objects(self, prefix=""):
+        # Maps each key already in the bucket to its (size, etag), so a re-run can skip unchanged files
+        # One paginated listing replaces a HEAD request per file
+        existing = {}
+        try:
+            paginator = self.boto_client.get_paginator("list_objects_v2")
+            for page in paginator.paginate(Bucket=self.bucket_name, Prefix=prefix):
+                for obj in page.get("Contents", []):
+                    existing[obj["Key"]] = (obj["Size"], obj["ETag"].strip('"'))
+        except Exception as e:
+            logger.warning(
+                f"Could not list existing objects, uploading everything: {e}"
+            )
+            return {}
+        return existing
+
+    def _is_uploaded(self, local_path, s3_key, size, existing):
+        if existing.get(s3_key, (None,))[0] != size:
+            return False
+        return _file_etag(local_path, size) == existing[s3_key][1]
+
+    def _upload_file(self, local_path, s3_key, existing=None):
+        size = os.stat(local_path).st_size
+        if existing and self._is_uploaded(local_path, s3_key, size, existing):
+            # Logged with lazy %-formatting, since this runs once per file
+            logger.info(
+                "Skipping %s, already uploaded to s3://%s/%s",
+                local_path,
+                self.bucket_name,
+                s3_key,
+            )
+            return
+        logger.info("Uploading %s to s3://%s/%s", local_path, self.bucket_name, s3_key)
+        if size < MULTIPART_THRESHOLD:
+            # Small files are sent with a single put_object, which skips the transfer manager's
+            # per-file thread, future and callback setup
+            with open(local_path, "rb") as f:
+                self.boto_client.put_object(
+                    Bucket=self.bucket_name, Key=s3_key, Body=f, ContentLength=size
+                )
+            return
+        self.boto_client.upload_file(
+            local_path, self.bucket_name, s3_key, Config=_transfer_config(size)
+        )
 
-                logging.info(
-                    f"Uploading {local_path} to s3://{self.bucket_name}/{s3_key}"
+    def upload_folder_to_space(self, folder_path, prefix="", max_workers=16):
+        existing = self._list_existing_objects(prefix)
+        # Uploads are bound by the round trip to Spaces, so files are uploaded concurrently
+        # The boto3 client is thread safe, so all workers share it
+        # Files are submitted as the folder is walked, so uploads start before the walk finishes
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [
+                executor.submit(
+                    self._upload_file,
+                    local_path,
+                    posixpath.join(prefix, relative_path),
+                    existing,
                 )
-                self.boto_client.upload_file(local_path, self.bucket_name, s3_key)
+                for local_path, relative_path in _walk_files(folder_path)
+            ]
+            # Surface the first upload error, if any
+            for future in concurrent.futures.as_completed(futures):
+                future.result()
+
+    def _bucket_exists(self):
+        try:
+            self.boto_client.head_bucket(Bucket=self.bucket_name)
+            return True
+        except Exception as e:
+            logger.info(f"Bucket {self.bucket_name} is not available yet: {e}")
+            return False
 
     def create_bucket(self):
         self.boto_client.create_bucket(Bucket=self.bucket_name)
+        # Wait for the bucket creation request to be accepted before it is used
+        if not _wait_until(self._bucket_exists):
+            logger.warning(
+                f"Bucket {self.bucket_name} was not available after 60 seconds. Continuing anyway..."
+            )
+
+    @_retry_on_throttle
+    def move_bucket_to_project(self):
         # When a bucket is created, it is always added to the default project
         # The bucket needs to be moved into the project with the agent and DB
-        bucket_urn = f"do:space:{self.bucket_name}"
-        # Wait for a few seconds for the bucket creation request to be accepted
-        time.sleep(5)
-        logging.info("Moving bucket into project...")
-        self.client.projects.assign_resources(
-            project_id=self.project_id, body={"resources": [bucket_urn]}
+        logger.info("Moving bucket into project...")
+        return self.client.projects.assign_resources(
+            project_id=self.project_id,
+            body={"resources": [f"do:space:{self.bucket_name}"]},
         )
 
+    @_retry_on_throttle
     def delete_generated_key(self):
         if self.generated_key:
             # This key was generated as part of the deployment. Delete it
-            logging.info("Deleting spaces key generated during deployment..")
+            logger.info("Deleting spaces key generated during deployment..")
             self.client.spaces_key.delete(access_key=self.access_key)
 
 
 # Deployment class for the agent using Pydo
 class AgentDeployer:
     def __init__(self, token: str):
-        self.client = pydo.Client(token=token)
+        self.client = _pydo_client(token)
 
     def _list_models(self):
         return self.client.genai.list_models()
 
+    def wait_for_kb(self, kb_uuid: str):
+        # Poll until the knowledge base can be fetched, so an indexing job can be created on it
+        def _kb_exists():
+            try:
+                self.client.genai.get_knowledge_base(kb_uuid)
+                return True
+            except Exception as e:
+                logger.info(f"Knowledge base {kb_uuid} is not available yet: {e}")
+                return False
+
+        if not _wait_until(_kb_exists):
+            logger.warning(
+                f"Knowledge base {kb_uuid} was not available after 60 seconds. Continuing anyway..."
+            )
+
+    def wait_for_agent(self, agent_uuid: str):
+        # Poll until the agent can be fetched, which means it can accept update requests
+        def _agent_exists():
+            try:
+                self.client.genai.get_agent(agent_uuid)
+                return True
+            except Exception as e:
+                logger.info(f"Agent {agent_uuid} is not available yet: {e}")
+                return False
+
+        if not _wait_until(_agent_exists):
+            logger.warning(
+                f"Agent {agent_uuid} was not available after 60 seconds. Continuing anyway..."
+            )
+
+    @_retry_on_throttle
     def deploy_kb(self, config: KBConfig):
         kb_deployment = self.client.genai.create_knowledge_base(body=config.to_dict())
         return kb_deployment
 
+    @_retry_on_throttle
     def index_kb(self, kb_uuid: str):
         kb_indexing = self.client.genai.create_indexing_job(
             body={
@@ -181,6 +466,7 @@ class AgentDeployer:
         )
         return kb_indexing
 
+    @_retry_on_throttle
     def _deploy_agent(self, config: AgentConfig):
         deployment = self.client.genai.create_agent(
             body=config.to_dict(),
@@ -215,6 +501,7 @@ class AgentDeployer:
         deployment = self._deploy_agent(config)
         return deployment
 
+    @_retry_on_throttle
     def update_agent_retrieval(self, agent_id: str):
         # Update the retrieval mechanism for the agent
         return self.client.genai.update_agent(
@@ -229,7 +516,8 @@ class AgentDeployer:
         )
 
 
-def deploy_pdocs_agent_template(
+# pydo and boto3 are blocking, so each call runs in a worker thread and independent steps are awaited together
+async def deploy_pdocs_agent_template_async(
     token: str,
     project_id: str,
     product_name: str,
@@ -244,87 +532,168 @@ def deploy_pdocs_agent_template(
     access_key: Optional[str] = None,
     secret_key: Optional[str] = None,
     agent_name: Optional[str] = None,
+    upload_workers: int = 16,
 ):
     try:
+        checkpoint = DeployCheckpoint(bucket_name)
         agent_deployer = AgentDeployer(token)
 
-        # First, create a new spaces bucket for the data
-        spaces_deployer = SpacesDeployer(
-            token=token,
-            project_id=project_id,
-            bucket_name=bucket_name,
-            region=region,
-            spaces_access_key=access_key,
-            spaces_secret_access_key=secret_key,
-        )
-
-        # Next create a bucket, upload the data to the bucket, and delete any temporary keys created in the process
-        logging.info("Creating a new bucket...")
-        spaces_deployer.create_bucket()
-        logging.info("Uploading data to bucket..")
-        spaces_deployer.upload_folder_to_space(documentation_path)
-        spaces_deployer.delete_generated_key()
-
-        # With the bucket created, instantiate a new KB
-        kb_config = KBConfig(
-            name=kb_name,
-            project_id=project_id,
-            spaces_bucket=bucket_name,
-            region=region,
-            embedding_model_uuid=embedding_model,
-            database_id=database_id,
-        )
-        logging.info("Deploying knowledge base..")
-        kb_deployment = agent_deployer.deploy_kb(kb_config)
-        kb_uuid = kb_deployment.get("knowledge_base", {}).get("uuid")
+        if not (checkpoint.get("uploaded") and checkpoint.get("bucket_moved")):
+            # First, create a new spaces bucket for the data
+            spaces_deployer = await asyncio.to_thread(
+                SpacesDeployer,
+                token=token,
+                project_id=project_id,
+                bucket_name=bucket_name,
+                region=region,
+                spaces_access_key=access_key,
+                spaces_secret_access_key=secret_key,
+            )
 
-        if database_id is not None:
-            logging.info(
+            # Next create a bucket, upload the data to the bucket, and delete any temporary keys created in the process
+            if not checkpoint.get("bucket_created"):
+                logger.info("Creating a new bucket...")
+                await asyncio.to_thread(spaces_deployer.create_bucket)
+                checkpoint.update(bucket_created=True)
+
+            async def _move_bucket():
+                if checkpoint.get("bucket_moved"):
+                    return
+                await asyncio.to_thread(spaces_deployer.move_bucket_to_project)
+                checkpoint.update(bucket_moved=True)
+
+            async def _upload_and_delete_key():
+                if not checkpoint.get("uploaded"):
+                    logger.info("Uploading data to bucket..")
+                    await asyncio.to_thread(
+                        spaces_deployer.upload_folder_to_space,
+                        documentation_path,
+                        max_workers=upload_workers,
+                    )
+                    checkpoint.update(uploaded=True)
+                await asyncio.to_thread(spaces_deployer.delete_generated_key)
+
+            # Moving the bucket into the project doesn't depend on its contents, so it happens while the data uploads
+            # The key is only needed for the upload, so it is deleted as soon as the upload finishes, even if the move is still running
+            await asyncio.gather(_move_bucket(), _upload_and_delete_key())
+
+        kb_uuid = checkpoint.get("kb_uuid")
+        if kb_uuid is None:
+            # With the bucket created, instantiate a new KB
+            kb_config = KBConfig(
+                name=kb_name,
+                project_id=project_id,
+                spaces_bucket=bucket_name,
+                region=region,
+                embedding_model_uuid=embedding_model,
+                database_id=database_id,
+            )
+            logger.info("Deploying knowledge base..")
+            kb_deployment = await asyncio.to_thread(agent_deployer.deploy_kb, kb_config)
+            kb_uuid = kb_deployment.get("knowledge_base", {}).get("uuid")
+            checkpoint.update(kb_uuid=kb_uuid)
+
+        async def _index_kb():
+            if database_id is None or checkpoint.get("indexed"):
+                return
+            logger.info(
                 "An existing database was used. Creating an indexing job on the KB. This may take a few seconds..."
             )
-            # As a precaution, wait for a few seconds before sending the request to trigger indexing
-            time.sleep(5)
-            agent_deployer.index_kb(kb_uuid)
-
-        logging.info("Deploying agent...")
-        agent_deployment = agent_deployer.create_template_agent(
-            project_id=project_id,
-            product_name=product_name,
-            product_description=product_description,
-            knowledge_base_uuid=kb_uuid,
-            region=region,
-            agent_name=agent_name,
-            model_uuid=model_uuid,
-        )
-        agent_uuid = agent_deployment.get("agent", {}).get("uuid")
+            # Wait for the KB to be available before sending the request to trigger indexing
+            await asyncio.to_thread(agent_deployer.wait_for_kb, kb_uuid)
+            await asyncio.to_thread(agent_deployer.index_kb, kb_uuid)
+            checkpoint.update(indexed=True)
+
+        async def _deploy_agent():
+            agent_uuid = checkpoint.get("agent_uuid")
+            if agent_uuid is None:
+                logger.info("Deploying agent...")
+                agent_deployment = await asyncio.to_thread(
+                    agent_deployer.create_template_agent,
+                    project_id=project_id,
+                    product_name=product_name,
+                    product_description=product_description,
+                    knowledge_base_uuid=kb_uuid,
+                    region=region,
+                    agent_name=agent_name,
+                    model_uuid=model_uuid,
+                )
+                agent_uuid = agent_deployment.get("agent", {}).get("uuid")
+                checkpoint.update(agent_uuid=agent_uuid)
 
-        # The API to create an agent does not yet support specifying retrieval options
-        # To set the retrieval options to improve query performance, we use the update API
+            # The API to create an agent does not yet support specifying retrieval options
+            # To set the retrieval options to improve query performance, we use the update API
 
-        logging.info(
-            "Updating agent retrieval settings. This may take a few seconds..."
-        )
+            logger.info(
+                "Updating agent retrieval settings. This may take a few seconds..."
+            )
 
-        # Sending an update request immediately after creating an agent may cause errors
-        # However, an update request does not require the agent to finish deployment
-        # As such, instead of waiting for deployment to finish, which can take some time, we simply wait for a few seconds
+            # Sending an update request immediately after creating an agent may cause errors
+            # However, an update request does not require the agent to finish deployment
+            # As such, instead of waiting for deployment to finish, which can take some time, we only wait until the agent can be fetched
+            await asyncio.to_thread(agent_deployer.wait_for_agent, agent_uuid)
+            await asyncio.to_thread(agent_deployer.update_agent_retrieval, agent_uuid)
+            return agent_uuid
 
-        time.sleep(10)
-        agent_deployer.update_agent_retrieval(agent_uuid)
+        # Indexing only needs the KB, so it is triggered while the agent is created and configured
+        _, agent_uuid = await asyncio.gather(_index_kb(), _deploy_agent())
+        # Every step finished, so a later run with the same bucket name starts a new deployment
+        checkpoint.clear()
 
-        logging.info(
+        logger.info(
             f"Product documentation agent deployment completed!\nYou can find your agent at : https://cloud.digitalocean.com/gen-ai/agents/{agent_uuid}\nNote:It may be a few minutes before your agent is ready to use as its knowledge base may still be indexing."
         )
 
     except Exception as e:
-        logging.error(f"An error occurred: {e}", exc_info=True)
+        logger.error(f"An error occurred: {e}", exc_info=True)
         raise
 
 
-def get_arg_or_env(arg_value, env_var, default=None, nullable=True):
+def deploy_pdocs_agent_template(
+    token: str,
+    project_id: str,
+    product_name: str,
+    product_description: str,
+    kb_name: str,
+    bucket_name: str,
+    documentation_path: str,
+    region: str = "tor1",
+    embedding_model: str = EMBEDDING_MODEL_UUID,
+    model_uuid: str = LLAMA_3_3_70B_UUID,
+    database_id: Optional[str] = None,
+    access_key: Optional[str] = None,
+    secret_key: Optional[str] = None,
+    agent_name: Optional[str] = None,
+    upload_workers: int = 16,
+):
+    asyncio.run(
+        deploy_pdocs_agent_template_async(
+            token=token,
+            project_id=project_id,
+            product_name=product_name,
+            product_description=product_description,
+            kb_name=kb_name,
+            bucket_name=bucket_name,
+            documentation_path=documentation_path,
+            region=region,
+            embedding_model=embedding_model,
+            model_uuid=model_uuid,
+            database_id=database_id,
+            access_key=access_key,
+            secret_key=secret_key,
+            agent_name=agent_name,
+            upload_workers=upload_workers,
+        )
+    )
+
+
+def get_arg_or_env(arg_value, env_var, default=None, nullable=True, env=None):
+    # env is an optional snapshot of the environment, os.environ is used otherwise
     if arg_value is not None:
         return arg_value
-    val = os.getenv(env_var, default)
+    if env is None:
+        env = os.environ
+    val = env.get(env_var, default)
     if not nullable and val is None:
         raise ValueError(f"{env_var} cannot be None. Please specify it.")
     return val
@@ -366,33 +735,59 @@ def main():
         "--agent-name",
         help=f"Optional: The name of the agent. If not provided, '{AGENT_NAME}' is used",
     )
+    parser.add_argument(
+        "--upload-workers",
+        type=int,
+        help="Optional: Number of documentation files uploaded concurrently. Defaults to 16",
+    )
 
     args = parser.parse_args()
 
+    # Configure logging
+    logging.basicConfig(
+        level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s"
+    )
+
     if args.env_file:
+        from dotenv import load_dotenv
+
         load_dotenv(dotenv_path=args.env_file)
 
+    # The environment is read once, after any .env has been loaded
+    env = dict(os.environ)
+
     deploy_pdocs_agent_template(
-        token=get_arg_or_env(args.token, "DIGITALOCEAN_TOKEN", nullable=False),
-        project_id=get_arg_or_env(args.project_id, "PROJECT_ID", nullable=False),
-        product_name=get_arg_or_env(args.product_name, "PRODUCT_NAME", nullable=False),
+        token=get_arg_or_env(args.token, "DIGITALOCEAN_TOKEN", nullable=False, env=env),
+        project_id=get_arg_or_env(
+            args.project_id, "PROJECT_ID", nullable=False, env=env
+        ),
+        product_name=get_arg_or_env(
+            args.product_name, "PRODUCT_NAME", nullable=False, env=env
+        ),
         product_description=get_arg_or_env(
-            args.product_description, "PRODUCT_DESCRIPTION", nullable=False
+            args.product_description, "PRODUCT_DESCRIPTION", nullable=False, env=env
+        ),
+        kb_name=get_arg_or_env(args.kb_name, "KB_NAME", nullable=False, env=env),
+        bucket_name=get_arg_or_env(
+            args.bucket_name, "BUCKET_NAME", nullable=False, env=env
         ),
-        kb_name=get_arg_or_env(args.kb_name, "KB_NAME", nullable=False),
-        bucket_name=get_arg_or_env(args.bucket_name, "BUCKET_NAME", nullable=False),
         documentation_path=get_arg_or_env(
-            args.documentation_path, "DOCUMENTATION_PATH", nullable=False
+            args.documentation_path, "DOCUMENTATION_PATH", nullable=False, env=env
         ),
-        region=get_arg_or_env(args.region, "REGION", "tor1"),
+        region=get_arg_or_env(args.region, "REGION", "tor1", env=env),
         embedding_model=get_arg_or_env(
-            args.embedding_model, "EMBEDDING_MODEL", EMBEDDING_MODEL_UUID
+            args.embedding_model, "EMBEDDING_MODEL", EMBEDDING_MODEL_UUID, env=env
+        ),
+        model_uuid=get_arg_or_env(
+            args.model_uuid, "MODEL_UUID", LLAMA_3_3_70B_UUID, env=env
+        ),
+        database_id=get_arg_or_env(args.database_id, "DATABASE_ID", env=env),
+        access_key=get_arg_or_env(args.access_key, "SPACES_ACCESS_KEY", env=env),
+        secret_key=get_arg_or_env(args.secret_key, "SPACES_SECRET_KEY", env=env),
+        agent_name=get_arg_or_env(args.agent_name, "AGENT_NAME", env=env),
+        upload_workers=int(
+            get_arg_or_env(args.upload_workers, "UPLOAD_WORKERS", 16, env=env)
         ),
-        model_uuid=get_arg_or_env(args.model_uuid, "MODEL_UUID", LLAMA_3_3_70B_UUID),
-        database_id=get_arg_or_env(args.database_id, "DATABASE_ID"),
-        access_key=get_arg_or_env(args.access_key, "SPACES_ACCESS_KEY"),
-        secret_key=get_arg_or_env(args.secret_key, "SPACES_SECRET_KEY"),
-        agent_name=get_arg_or_env(args.agent_name, "AGENT_NAME"),
     )
 
 
@@ -6,9 +6,7 @@ import argparse
 import boto3
 import time
 from typing import Optional
-from agent.prompts import (
-    SYSTEM_PROMPT_TEMPLATE,
-)
+from agent.prompts import render
 from agent.constants import LLAMA_3_3_70B_UUID, EMBEDDING_MODEL_UUID, AGENT_NAME
 from dataclasses import dataclass
 from dotenv import load_dotenv
@@ -242,9 +240,7 @@ class AgentDeployer:
         agent_name: Optional[str] = AGENT_NAME,
         model_uuid: Optional[str] = LLAMA_3_3_70B_UUID,
     ):
-        system_instructions = SYSTEM_PROMPT_TEMPLATE.format(
-            data_description=data_description,
-        )
+        system_instructions = render(data_description)
         # Create the config
         config = AgentConfig(
             agent_name=agent_name or AGENT_NAME,